@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .models import AgentConfig
+from .zed_agent import ZedAgentConnection
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the background initialize handshake of a pre-started agent.
+_WARM_TIMEOUT = 30.0
+
+_PoolKey = Tuple[str, Tuple[str, ...], Optional[str]]
+
+
+class _ParkedSession(NamedTuple):
+    """A connection kept alive between runs of one ACP session."""
+
+    key: _PoolKey
+    connection: ZedAgentConnection
+    zed_session_id: str
+    expiry: asyncio.TimerHandle
+
+
+def _pool_key(agent: AgentConfig) -> _PoolKey:
+    # Key on the launch parameters too, so a reloaded config never hands out
+    # a process started with an outdated command or API key.
+    return agent.name, tuple(agent.command), agent.api_key
+
+
+class AgentConnectionPool:
+    """Keep started and initialized agent processes ready for new runs.
+
+    Fresh connections are single-use: a checked-out process serves one run
+    and is closed afterwards, so no session state or late notifications leak
+    between runs. Spawning the replacement happens in the background, which
+    keeps process start-up and the ``initialize`` handshake off the request path.
+
+    The exception is a stateful run that completed normally: its process is
+    parked under the ACP session ID for ``session_keepalive`` seconds, and the
+    session's next run picks it up with the ZedACP session still loaded. At
+    most ``max_parked_sessions`` processes are parked; beyond that the one
+    parked longest ago is shut down.
+    """
+
+    def __init__(
+        self, size: int = 1, session_keepalive: float = 300.0, max_parked_sessions: int = 32
+    ) -> None:
+        self._size = size
+        self._session_keepalive = session_keepalive
+        self._max_parked_sessions = max_parked_sessions
+        self._idle: Dict[_PoolKey, List[ZedAgentConnection]] = {}
+        self._starting: Dict[_PoolKey, int] = {}
+        self._sessions: Dict[str, _ParkedSession] = {}
+        self._tasks: Set[asyncio.Task[None]] = set()
+
+    def warm(self, agents: Iterable[AgentConfig]) -> None:
+        """Start pre-spawning connections for every configured agent in the background."""
+        if self._size <= 0:
+            return
+        for agent in agents:
+            self._spawn_task(self._fill(agent))
+
+    async def checkout(self, agent: AgentConfig) -> ZedAgentConnection:
+        """Return an initialized connection, spawning one inline if none is warm."""
+        idle = self._idle.get(_pool_key(agent))
+        connection = None
+        while idle:
+            candidate = idle.pop()
+            if candidate.running:
+                connection = candidate
+                break
+            self._spawn_task(candidate.close())
+        if self._size > 0:
+            self._spawn_task(self._fill(agent))
+        if connection is not None:
+            return connection
+
+        connection = ZedAgentConnection(agent.command, api_key=agent.api_key)
+        await connection.start()
+        try:
+            await connection.initialize()
+        except BaseException:
+            await connection.close()
+            raise
+        return connection
+
+    async def checkout_session(
+        self, agent: AgentConfig, acp_session_id: str
+    ) -> Tuple[ZedAgentConnection, Optional[str]]:
+        """Return the connection parked for an ACP session and its loaded ZedACP session ID.
+
+        Falls back to :meth:`checkout` with no session ID when nothing usable is parked.
+        """
+        parked = self._sessions.pop(acp_session_id, None)
+        if parked is not None:
+            parked.expiry.cancel()
+            if parked.key == _pool_key(agent) and parked.connection.running:
+                return parked.connection, parked.zed_session_id
+            self._spawn_task(parked.connection.close())
+        return await self.checkout(agent), None
+
+    def checkin(
+        self,
+        connection: ZedAgentConnection,
+        agent: Optional[AgentConfig] = None,
+        acp_session_id: Optional[str] = None,
+        zed_session_id: Optional[str] = None,
+    ) -> None:
+        """Release a connection after its run.
+
+        With an ACP and ZedACP session ID the connection is parked for the
+        session's next run; otherwise the process is shut down in the background.
+        """
+        if (
+            agent is not None
+            and acp_session_id is not None
+            and zed_session_id is not None
+            and self._session_keepalive > 0
+            and self._max_parked_sessions > 0
+            and connection.running
+        ):
+            self.release_session(acp_session_id)
+            # Dicts keep insertion order, so the first entry was parked longest ago
+            while len(self._sessions) >= self._max_parked_sessions:
+                self.release_session(next(iter(self._sessions)))
+            expiry = asyncio.get_running_loop().call_later(
+                self._session_keepalive, self._expire, acp_session_id, connection
+            )
+            self._sessions[acp_session_id] = _ParkedSession(
+                _pool_key(agent), connection, zed_session_id, expiry
+            )
+            return
+        self._spawn_task(connection.close())
+
+    def release_session(self, acp_session_id: str) -> None:
+        """Shut down the connection parked for an ACP session, if any."""
+        parked = self._sessions.pop(acp_session_id, None)
+        if parked is not None:
+            parked.expiry.cancel()
+            self._spawn_task(parked.connection.close())
+
+    def _expire(self, acp_session_id: str, connection: ZedAgentConnection) -> None:
+        parked = self._sessions.get(acp_session_id)
+        if parked is not None and parked.connection is connection:
+            self.release_session(acp_session_id)
+
+    async def close(self) -> None:
+        """Close idle connections and wait for pending spawns and shutdowns."""
+        for acp_session_id in list(self._sessions):
+            self.release_session(acp_session_id)
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        idle = [connection for connections in self._idle.values() for connection in connections]
+        self._idle.clear()
+        await asyncio.gather(*(connection.close() for connection in idle), return_exceptions=True)
+
+    def _spawn_task(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fill(self, agent: AgentConfig) -> None:
+        key = _pool_key(agent)
+        idle = self._idle.setdefault(key, [])
+        while len(idle) + self._starting.get(key, 0) < self._size:
+            self._starting[key] = self._starting.get(key, 0) + 1
+            connection = ZedAgentConnection(agent.command, api_key=agent.api_key)
+            try:
+                await connection.start()
+                await asyncio.wait_for(connection.initialize(), _WARM_TIMEOUT)
+            except Exception as exc:
+                logger.warning(
+                    "Failed to pre-start agent connection",
+                    extra={"agent": agent.name, "error": str(exc)},
+                )
+                await connection.close()
+                return
+            finally:
+                self._starting[key] -= 1
+            idle.append(connection)
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
-import json
 import logging
 from pathlib import Path
-from typing import Dict, Iterable
+from typing import Dict, Iterable, Optional
+
+import orjson
 
 from .models import AgentConfig, AgentManifest, AgentManifestCapabilities, RunMode
 from .settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Every agent is exposed with the same capabilities, so build them once.
+_DEFAULT_CAPABILITIES = AgentManifestCapabilities(
+    modes=[RunMode.sync, RunMode.stream],
+    supports_streaming=True,
+    supports_cancellation=True,
+)
+
 
 class AgentRegistry:
     """In-memory registry for configured agents."""
@@ -18,20 +26,32 @@ class AgentRegistry:
         settings = get_settings()
         self._config_path = Path(config_path or settings.agents_config_path)
         self._agents: Dict[str, AgentConfig] = {}
+        self._manifests: Dict[str, AgentManifest] = {}
+        self._mtime_ns: Optional[int] = None
         self.reload()
 
     def reload(self) -> None:
-        """Reload configuration from disk."""
+        """Reload configuration from disk if it changed since the last load."""
+        try:
+            mtime_ns = self._config_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Agents configuration not found: {self._config_path}") from None
+        if mtime_ns == self._mtime_ns and self._agents:
+            return
         logger.debug("Loading agents configuration", extra={"path": str(self._config_path)})
-        if not self._config_path.exists():
-            raise FileNotFoundError(f"Agents configuration not found: {self._config_path}")
-        data = json.loads(self._config_path.read_text())
-        self._agents = {name: AgentConfig(**payload) for name, payload in data.items()}
+        data = orjson.loads(self._config_path.read_bytes())
+        self._agents = {name: AgentConfig.model_validate(payload) for name, payload in data.items()}
+        self._manifests.clear()
+        self._mtime_ns = mtime_ns
 
     def list(self) -> Iterable[AgentConfig]:
         """Iterate over configured agents."""
         return self._agents.values()
 
+    def configs(self) -> Dict[str, AgentConfig]:
+        """Return a snapshot of the validated agent configurations keyed by name."""
+        return dict(self._agents)
+
     def get(self, name: str) -> AgentConfig:
         """Retrieve a single agent."""
         try:
@@ -41,17 +61,17 @@ class AgentRegistry:
 
     def manifest_for(self, name: str) -> AgentManifest:
         """Return a static manifest for a given agent."""
+        manifest = self._manifests.get(name)
+        if manifest is not None:
+            return manifest
         agent = self.get(name)
         description = agent.description or f"ZedACP agent '{agent.name}' exposed over IBMACP."
         version = agent.version or "0.1.0"
-        capabilities = AgentManifestCapabilities(
-            modes=[RunMode.sync, RunMode.stream],
-            supports_streaming=True,
-            supports_cancellation=True,
-        )
-        return AgentManifest(
+        manifest = AgentManifest(
             name=agent.name,
             description=description,
             version=version,
-            capabilities=capabilities,
+            capabilities=_DEFAULT_CAPABILITIES,
         )
+        self._manifests[name] = manifest
+        return manifest
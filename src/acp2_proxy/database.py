@@ -6,18 +6,280 @@ enabling stateful agent conversations across multiple runs.
 """
 
 import asyncio
-import json
+import logging
 import sqlite3
-import threading
-from contextlib import contextmanager
-from dataclasses import dataclass, asdict
-from datetime import datetime
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+import orjson
+
 from src.acp2_proxy.models import Message
 
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+def _dumps(value: Any) -> str:
+    """Encode a JSON column value."""
+    return orjson.dumps(value).decode()
+
+
+# Message payload columns hold orjson-encoded BLOBs; orjson.loads also reads the
+# TEXT values written by older versions.
+_dumps_blob = orjson.dumps
+_loads = orjson.loads
+
+# Timestamps are stored as integer microseconds since the Unix epoch (UTC).
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+_MICROSECONDS_PER_DAY = 86_400 * 1_000_000
+
+
+def _to_epoch_us(value: datetime) -> int:
+    """Convert a naive UTC datetime to epoch microseconds."""
+    return (value - _EPOCH) // _ONE_MICROSECOND
 
-@dataclass
+
+def _now_epoch_us() -> int:
+    """Return the current UTC time in epoch microseconds without building a datetime."""
+    return time.time_ns() // 1_000
+
+
+def _from_epoch_us(value: int) -> datetime:
+    """Convert epoch microseconds to a naive UTC datetime."""
+    return _EPOCH + timedelta(microseconds=value)
+
+
+# Slotted dataclasses drop the per-instance __dict__; slots= needs Python 3.10+.
+_DATACLASS_SLOTS: Dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Size of sqlite3's per-connection LRU of compiled statements.
+_STATEMENT_CACHE_SIZE = 256
+
+_SESSION_COLUMNS = (
+    "acp_session_id, agent_name, zed_session_id, working_directory, "
+    "created_at, updated_at, is_active, last_run_id, metadata"
+)
+# History columns without the (potentially large) JSON message payloads.
+_HISTORY_SUMMARY_COLUMNS = (
+    "id, acp_session_id, run_id, message_role, created_at, sequence_number"
+)
+_HISTORY_COLUMNS = f"{_HISTORY_SUMMARY_COLUMNS}, message_data, zed_message_data"
+
+# All SQL issued by SessionDatabase. sqlite3 keys its statement cache on the
+# SQL text, so routing every call through the same string objects keeps the
+# compiled statements hot instead of re-parsing and re-planning them per call.
+_SQL: Dict[str, str] = {
+    "create_sessions_table": """
+        CREATE TABLE IF NOT EXISTS acp_sessions (
+            acp_session_id TEXT PRIMARY KEY,
+            agent_name TEXT NOT NULL,
+            zed_session_id TEXT NOT NULL,
+            working_directory TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            last_run_id TEXT,
+            metadata TEXT
+        )
+    """,
+    "create_history_table": """
+        CREATE TABLE IF NOT EXISTS session_history (
+            id INTEGER PRIMARY KEY,
+            acp_session_id TEXT NOT NULL REFERENCES acp_sessions(acp_session_id),
+            run_id TEXT NOT NULL,
+            message_role TEXT NOT NULL,
+            message_data BLOB NOT NULL,
+            created_at INTEGER NOT NULL,
+            sequence_number INTEGER,
+            zed_message_data BLOB
+        )
+    """,
+    "create_sessions_agent_index": """
+        CREATE INDEX IF NOT EXISTS idx_acp_sessions_agent_active
+        ON acp_sessions(agent_name, is_active)
+    """,
+    "create_sessions_cleanup_index": """
+        CREATE INDEX IF NOT EXISTS idx_acp_sessions_active_updated
+        ON acp_sessions(is_active, updated_at)
+    """,
+    "drop_history_created_at_index": "DROP INDEX IF EXISTS idx_session_history_acp_session",
+    "create_history_cursor_index": """
+        CREATE INDEX IF NOT EXISTS idx_session_history_acp_session_id
+        ON session_history(acp_session_id, id)
+    """,
+    "upsert_session": """
+        INSERT OR REPLACE INTO acp_sessions
+        (acp_session_id, agent_name, zed_session_id, working_directory,
+         created_at, updated_at, is_active, metadata)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "get_session": f"SELECT {_SESSION_COLUMNS} FROM acp_sessions WHERE acp_session_id = ?",
+    "update_zed_session_id": """
+        UPDATE acp_sessions
+        SET zed_session_id = ?, updated_at = ?
+        WHERE acp_session_id = ?
+    """,
+    "touch_session": "UPDATE acp_sessions SET updated_at = ? WHERE acp_session_id = ?",
+    "update_session_activity": """
+        UPDATE acp_sessions
+        SET updated_at = ?, last_run_id = ?
+        WHERE acp_session_id = ?
+    """,
+    "insert_history": """
+        INSERT INTO session_history
+        (acp_session_id, run_id, message_role, message_data, created_at,
+         sequence_number, zed_message_data)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+    "get_history": f"""
+        SELECT {_HISTORY_COLUMNS} FROM session_history
+        WHERE acp_session_id = ? AND id > ?
+        ORDER BY id ASC
+    """,
+    "get_history_limit": f"""
+        SELECT {_HISTORY_COLUMNS} FROM session_history
+        WHERE acp_session_id = ? AND id > ?
+        ORDER BY id ASC
+        LIMIT ?
+    """,
+    "get_history_summary": f"""
+        SELECT {_HISTORY_SUMMARY_COLUMNS} FROM session_history
+        WHERE acp_session_id = ? AND id > ?
+        ORDER BY id ASC
+    """,
+    "get_history_summary_limit": f"""
+        SELECT {_HISTORY_SUMMARY_COLUMNS} FROM session_history
+        WHERE acp_session_id = ? AND id > ?
+        ORDER BY id ASC
+        LIMIT ?
+    """,
+    "count_history": "SELECT COUNT(*) FROM session_history WHERE acp_session_id = ?",
+    "list_sessions": f"SELECT {_SESSION_COLUMNS} FROM acp_sessions ORDER BY updated_at DESC",
+    "list_sessions_active": f"""
+        SELECT {_SESSION_COLUMNS} FROM acp_sessions WHERE is_active = 1
+        ORDER BY updated_at DESC
+    """,
+    "list_sessions_by_agent": f"""
+        SELECT {_SESSION_COLUMNS} FROM acp_sessions WHERE agent_name = ?
+        ORDER BY updated_at DESC
+    """,
+    "list_sessions_by_agent_active": f"""
+        SELECT {_SESSION_COLUMNS} FROM acp_sessions WHERE agent_name = ? AND is_active = 1
+        ORDER BY updated_at DESC
+    """,
+    "list_session_ids": "SELECT acp_session_id, agent_name, updated_at FROM acp_sessions",
+    "list_session_ids_active": """
+        SELECT acp_session_id, agent_name, updated_at FROM acp_sessions
+        WHERE is_active = 1
+    """,
+    "list_session_ids_by_agent": """
+        SELECT acp_session_id, agent_name, updated_at FROM acp_sessions
+        WHERE agent_name = ?
+    """,
+    "list_session_ids_by_agent_active": """
+        SELECT acp_session_id, agent_name, updated_at FROM acp_sessions
+        WHERE agent_name = ? AND is_active = 1
+    """,
+    "delete_history": "DELETE FROM session_history WHERE acp_session_id = ?",
+    "delete_session": "DELETE FROM acp_sessions WHERE acp_session_id = ?",
+    "migrate_history_payloads_to_blob": """
+        UPDATE session_history
+        SET message_data = CAST(message_data AS BLOB),
+            zed_message_data = CAST(zed_message_data AS BLOB)
+        WHERE typeof(message_data) = 'text'
+    """,
+    "rename_legacy_sessions_table": "ALTER TABLE acp_sessions RENAME TO acp_sessions_legacy",
+    "rename_legacy_history_table": "ALTER TABLE session_history RENAME TO session_history_legacy",
+    "select_legacy_sessions": f"SELECT {_SESSION_COLUMNS} FROM acp_sessions_legacy",
+    "select_legacy_history": f"SELECT {_HISTORY_COLUMNS} FROM session_history_legacy",
+    "copy_legacy_session": f"""
+        INSERT INTO acp_sessions ({_SESSION_COLUMNS})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "copy_legacy_history": f"""
+        INSERT INTO session_history ({_HISTORY_COLUMNS})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "drop_legacy_history_table": "DROP TABLE session_history_legacy",
+    "drop_legacy_sessions_table": "DROP TABLE acp_sessions_legacy",
+    "cleanup_inactive_sessions": """
+        DELETE FROM acp_sessions
+        WHERE is_active = 0 AND updated_at < ?
+    """,
+}
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run a block in an explicit write transaction on an autocommit connection."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _migrate_history_payloads_to_blob(conn: sqlite3.Connection) -> None:
+    conn.execute(_SQL["migrate_history_payloads_to_blob"])
+
+
+def _migrate_timestamps_to_epoch_us(conn: sqlite3.Connection) -> None:
+    """Rebuild tables created with TEXT isoformat timestamps as INTEGER epochs.
+
+    SQLite cannot change a column's declared type in place, and a TEXT column
+    would coerce integers back into strings, so both tables are recreated.
+    """
+    column_types = {
+        row[1]: row[2] for row in conn.execute("PRAGMA table_info(acp_sessions)")
+    }
+    if column_types.get("created_at", "").upper() != "TEXT":
+        return
+
+    def epoch(value: Any) -> Any:
+        return _to_epoch_us(datetime.fromisoformat(value)) if isinstance(value, str) else value
+
+    conn.execute(_SQL["rename_legacy_sessions_table"])
+    conn.execute(_SQL["rename_legacy_history_table"])
+    conn.execute(_SQL["create_sessions_table"])
+    conn.execute(_SQL["create_history_table"])
+    conn.executemany(_SQL["copy_legacy_session"], (
+        (*row[:4], epoch(row[4]), epoch(row[5]), *row[6:])
+        for row in conn.execute(_SQL["select_legacy_sessions"]).fetchall()
+    ))
+    conn.executemany(_SQL["copy_legacy_history"], (
+        (*row[:4], epoch(row[4]), *row[5:])
+        for row in conn.execute(_SQL["select_legacy_history"]).fetchall()
+    ))
+    conn.execute(_SQL["drop_legacy_history_table"])
+    conn.execute(_SQL["drop_legacy_sessions_table"])
+
+
+def _drop_history_created_at_index(conn: sqlite3.Connection) -> None:
+    # History is read by (acp_session_id, id); the created_at index only cost writes.
+    conn.execute(_SQL["drop_history_created_at_index"])
+
+
+# One-shot data migrations, applied in order to databases whose
+# ``PRAGMA user_version`` is below the migration's version.
+_MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _migrate_history_payloads_to_blob),
+    (2, _migrate_timestamps_to_epoch_us),
+    (3, _drop_history_created_at_index),
+]
+_SCHEMA_VERSION = _MIGRATIONS[-1][0]
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class ACPSession:
     """Represents an ACP session with ZedACP mapping."""
     acp_session_id: str
@@ -35,26 +297,43 @@ class ACPSession:
         data = asdict(self)
         data['created_at'] = self.created_at.isoformat()
         data['updated_at'] = self.updated_at.isoformat()
-        data['metadata'] = json.dumps(self.metadata) if self.metadata else None
+        data['metadata'] = _dumps(self.metadata) if self.metadata else None
         return data
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ACPSession':
         """Create from dictionary."""
+        data = dict(data)
         data['created_at'] = datetime.fromisoformat(data['created_at'])
         data['updated_at'] = datetime.fromisoformat(data['updated_at'])
-        data['metadata'] = json.loads(data['metadata']) if data['metadata'] else None
+        data['metadata'] = _loads(data['metadata']) if data['metadata'] else None
         return cls(**data)
 
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'ACPSession':
+        """Create directly from an ``acp_sessions`` row without an intermediate dict."""
+        metadata = row["metadata"]
+        return cls(
+            acp_session_id=row["acp_session_id"],
+            agent_name=row["agent_name"],
+            zed_session_id=row["zed_session_id"],
+            working_directory=row["working_directory"],
+            created_at=_from_epoch_us(row["created_at"]),
+            updated_at=_from_epoch_us(row["updated_at"]),
+            is_active=row["is_active"],
+            last_run_id=row["last_run_id"],
+            metadata=_loads(metadata) if metadata else None,
+        )
+
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class SessionHistory:
     """Represents a message in session history."""
     id: Optional[int]
     acp_session_id: str
     run_id: str
     message_role: str  # 'user' | 'assistant'
-    message_data: Dict[str, Any]  # Full IBM ACP Message
+    message_data: Dict[str, Any]  # Full IBM ACP Message (empty if loaded without payload)
     created_at: datetime
     sequence_number: int
     zed_message_data: Optional[Dict[str, Any]] = None  # ZedACP format
@@ -63,90 +342,244 @@ class SessionHistory:
         """Convert to dictionary for JSON serialization."""
         data = asdict(self)
         data['created_at'] = self.created_at.isoformat()
-        data['message_data'] = json.dumps(self.message_data)
-        data['zed_message_data'] = json.dumps(self.zed_message_data) if self.zed_message_data else None
+        data['message_data'] = _dumps(self.message_data)
+        data['zed_message_data'] = _dumps(self.zed_message_data) if self.zed_message_data else None
         return data
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'SessionHistory':
         """Create from dictionary."""
+        data = dict(data)
         data['created_at'] = datetime.fromisoformat(data['created_at'])
-        data['message_data'] = json.loads(data['message_data'])
-        data['zed_message_data'] = json.loads(data['zed_message_data']) if data['zed_message_data'] else None
+        data['message_data'] = _loads(data['message_data']) if 'message_data' in data else {}
+        data['zed_message_data'] = _loads(data['zed_message_data']) if data.get('zed_message_data') else None
         return cls(**data)
 
+    @classmethod
+    def from_row(cls, row: sqlite3.Row, include_payload: bool = True) -> 'SessionHistory':
+        """Create directly from a ``session_history`` row without an intermediate dict."""
+        message_data: Dict[str, Any] = {}
+        zed_message_data = None
+        if include_payload:
+            message_data = _loads(row["message_data"])
+            if row["zed_message_data"]:
+                zed_message_data = _loads(row["zed_message_data"])
+        return cls(
+            id=row["id"],
+            acp_session_id=row["acp_session_id"],
+            run_id=row["run_id"],
+            message_role=row["message_role"],
+            message_data=message_data,
+            created_at=_from_epoch_us(row["created_at"]),
+            sequence_number=row["sequence_number"],
+            zed_message_data=zed_message_data,
+        )
+
 
 class SessionDatabase:
     """
     SQLite database for ACP session persistence.
 
     Uses WAL mode for better concurrency and creates tables as needed.
-    Thread-safe through connection pooling.
+    Reads are served from a bounded pool of connections while writes are
+    serialized through a single writer connection, matching SQLite's
+    many-readers/one-writer model.
     """
 
-    def __init__(self, db_path: str = "acp2_sessions.db"):
+    def __init__(
+        self,
+        db_path: str = "acp2_sessions.db",
+        read_pool_size: int = 8,
+        history_batch_size: int = 500,
+        history_flush_ms: int = 50,
+        session_cache_size: int = 1024,
+    ):
         """Initialize database connection."""
         self.db_path = db_path
-        self._local = threading.local()
+        self._read_pool_size = max(1, read_pool_size)
+        self._readers: asyncio.Queue[sqlite3.Connection] = asyncio.Queue()
+        self._connections: List[sqlite3.Connection] = []
+        self._writer = self._connect()
+        self._write_lock = asyncio.Lock()
+        # History rows are buffered and written in batches; see flush_history().
+        self._history_batch_size = max(1, history_batch_size)
+        self._history_flush_interval = history_flush_ms / 1000
+        self._history_buffer: List[Tuple[Any, ...]] = []
+        # Sessions whose updated_at is bumped together with the buffered rows
+        self._pending_touches: Dict[str, int] = {}
+        self._history_flush_task: Optional[asyncio.Task[None]] = None
+        # LRU of recently read sessions; every completed write to a session evicts it.
+        self._session_cache: "OrderedDict[str, ACPSession]" = OrderedDict()
+        self._session_cache_size = max(0, session_cache_size)
+        # Bumped on every invalidation, so a read that raced a write is not cached
+        self._session_generations: Dict[str, int] = {}
+        self._session_cache_epoch = 0
+        self.session_cache_hits = 0
+        self.session_cache_misses = 0
         self._init_database()
 
-    def _get_connection(self) -> sqlite3.Connection:
-        """Get thread-local database connection."""
-        if not hasattr(self._local, 'connection'):
-            self._local.connection = sqlite3.connect(
-                self.db_path,
-                check_same_thread=False
-            )
-            # Enable WAL mode for better concurrency
-            self._local.connection.execute("PRAGMA journal_mode=WAL")
-            self._local.connection.execute("PRAGMA synchronous=NORMAL")
-            self._local.connection.execute("PRAGMA cache_size=10000")
-            self._local.connection.execute("PRAGMA temp_store=memory")
-
-        return self._local.connection
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new tuned database connection."""
+        connection = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=_STATEMENT_CACHE_SIZE,
+            # Autocommit; multi-statement writes open explicit transactions
+            isolation_level=None,
+            # "file:" URIs allow e.g. shared-cache in-memory databases
+            uri=self.db_path.startswith("file:"),
+        )
+        # Enable WAL mode for better concurrency
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA cache_size=10000")
+        connection.execute("PRAGMA temp_store=memory")
+        # Wait for concurrent writers instead of failing with SQLITE_BUSY
+        connection.execute("PRAGMA busy_timeout=30000")
+        # Serve reads from memory-mapped pages (256 MiB)
+        connection.execute("PRAGMA mmap_size=268435456")
+        connection.execute("PRAGMA wal_autocheckpoint=1000")
+        connection.row_factory = sqlite3.Row
+        self._connections.append(connection)
+        return connection
+
+    async def _acquire_reader(self) -> sqlite3.Connection:
+        """Take a read connection from the pool, opening one if below capacity."""
+        if self._readers.empty() and len(self._connections) - 1 < self._read_pool_size:
+            return self._connect()
+        return await self._readers.get()
 
     def _init_database(self) -> None:
         """Initialize database schema."""
-        with self._get_connection() as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS acp_sessions (
-                    acp_session_id TEXT PRIMARY KEY,
-                    agent_name TEXT NOT NULL,
-                    zed_session_id TEXT NOT NULL,
-                    working_directory TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT 1,
-                    last_run_id TEXT,
-                    metadata TEXT
-                )
-            """)
-
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS session_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    acp_session_id TEXT NOT NULL REFERENCES acp_sessions(acp_session_id),
-                    run_id TEXT NOT NULL,
-                    message_role TEXT NOT NULL,
-                    message_data TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    sequence_number INTEGER,
-                    zed_message_data TEXT
-                )
-            """)
+        with _transaction(self._writer) as conn:
+            conn.execute(_SQL["create_sessions_table"])
+            conn.execute(_SQL["create_history_table"])
 
-            # Create indexes for performance
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_acp_sessions_agent_active
-                ON acp_sessions(agent_name, is_active)
-            """)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for migration_version, migrate in _MIGRATIONS:
+                if version < migration_version:
+                    migrate(conn)
+            if version < _SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
 
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_session_history_acp_session
-                ON session_history(acp_session_id, created_at)
-            """)
-
-            conn.commit()
+            # Create indexes for performance
+            conn.execute(_SQL["create_sessions_agent_index"])
+            conn.execute(_SQL["create_sessions_cleanup_index"])
+            conn.execute(_SQL["create_history_cursor_index"])
+
+    def _write_sync(self, statements: Sequence[Tuple[str, Sequence[Any]]]) -> int:
+        """Run statements in a single transaction, returning the last row count."""
+        if len(statements) == 1:
+            # Autocommit: a lone statement is already atomic
+            sql, params = statements[0]
+            return self._writer.execute(sql, params).rowcount
+
+        rowcount = 0
+        with _transaction(self._writer) as conn:
+            for sql, params in statements:
+                rowcount = conn.execute(sql, params).rowcount
+        return rowcount
+
+    def _write_many_sync(self, sql: str, rows: Sequence[Sequence[Any]]) -> None:
+        """Run one statement for every row in a single transaction."""
+        with _transaction(self._writer) as conn:
+            conn.executemany(sql, rows)
+
+    @staticmethod
+    def _fetch_sync(
+        conn: sqlite3.Connection, sql: str, params: Sequence[Any]
+    ) -> List[sqlite3.Row]:
+        """Run a query and return all rows."""
+        return conn.execute(sql, params).fetchall()
+
+    def _invalidate_session(self, acp_session_id: str) -> None:
+        """Drop a session from the read cache."""
+        self._session_cache.pop(acp_session_id, None)
+        self._session_generations[acp_session_id] = self._session_generations.get(acp_session_id, 0) + 1
+
+    def _refresh_cached_timestamp(self, acp_session_id: str, updated_at_us: int) -> None:
+        """Swap in a copy of a cached session with a new ``updated_at``.
+
+        Only the timestamp changed, so the entry stays cached; it is replaced
+        rather than mutated because callers may still hold the old object.
+        """
+        self._session_generations[acp_session_id] = self._session_generations.get(acp_session_id, 0) + 1
+        cached = self._session_cache.get(acp_session_id)
+        if cached is not None:
+            self._session_cache[acp_session_id] = replace(cached, updated_at=_from_epoch_us(updated_at_us))
+
+    def session_cache_stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for the session read cache."""
+        return {
+            "hits": self.session_cache_hits,
+            "misses": self.session_cache_misses,
+            "size": len(self._session_cache),
+        }
+
+    def _insert_history_sync(
+        self,
+        rows: List[Tuple[Any, ...]],
+        updates: Sequence[Tuple[str, Sequence[Any]]] = (),
+    ) -> None:
+        """Insert history rows and run ``updates`` in one transaction, one by one on failure."""
+        try:
+            with _transaction(self._writer) as conn:
+                conn.executemany(_SQL["insert_history"], rows)
+                for sql, params in updates:
+                    conn.execute(sql, params)
+            return
+        except sqlite3.Error:
+            logger.warning("Bulk history insert failed, retrying per row", extra={"rows": len(rows)})
+
+        for row in rows:
+            try:
+                self._writer.execute(_SQL["insert_history"], row)
+            except sqlite3.Error:
+                logger.exception("Dropping history row", extra={"acp_session_id": row[0], "run_id": row[1]})
+        for sql, params in updates:
+            self._writer.execute(sql, params)
+
+    def _take_pending_history(self) -> Tuple[List[Tuple[Any, ...]], List[Tuple[str, Sequence[Any]]]]:
+        """Swap out buffered history rows and the session touches queued with them."""
+        rows, self._history_buffer = self._history_buffer, []
+        touches, self._pending_touches = self._pending_touches, {}
+        updates = [
+            (_SQL["touch_session"], (updated_at, acp_session_id))
+            for acp_session_id, updated_at in touches.items()
+        ]
+        return rows, updates
+
+    async def _run_writer(self, func: Callable[..., _T], *args: Any) -> _T:
+        """Run ``func`` on a worker thread while holding the write lock.
+
+        The lock is held until the thread returns, even if the caller is
+        cancelled meanwhile: releasing it early would let the next writer start
+        a transaction on the writer connection while this one is still in use.
+        The cancellation is re-raised once the thread is done.
+        """
+        async with self._write_lock:
+            future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                while not future.done():
+                    with suppress(asyncio.CancelledError):
+                        await asyncio.wait((future,))
+                if not future.cancelled() and future.exception() is not None:
+                    logger.warning("Write failed after its caller was cancelled", exc_info=future.exception())
+                raise
+
+    async def _write(self, *statements: Tuple[str, Sequence[Any]]) -> int:
+        """Run write statements on the single writer connection off the event loop."""
+        return await self._run_writer(self._write_sync, statements)
+
+    async def _fetch(self, sql: str, params: Sequence[Any]) -> List[sqlite3.Row]:
+        """Run a query on a pooled read connection off the event loop."""
+        conn = await self._acquire_reader()
+        try:
+            return await asyncio.to_thread(self._fetch_sync, conn, sql, params)
+        finally:
+            self._readers.put_nowait(conn)
 
     async def create_acp_session(
         self,
@@ -157,7 +590,8 @@ class SessionDatabase:
         metadata: Optional[Dict[str, Any]] = None
     ) -> ACPSession:
         """Create a new ACP session record."""
-        now = datetime.utcnow()
+        now_us = _now_epoch_us()
+        now = _from_epoch_us(now_us)
         session = ACPSession(
             acp_session_id=acp_session_id,
             agent_name=agent,
@@ -168,52 +602,131 @@ class SessionDatabase:
             metadata=metadata
         )
 
-        with self._get_connection() as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO acp_sessions
-                (acp_session_id, agent_name, zed_session_id, working_directory,
-                 created_at, updated_at, is_active, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+        await self._write((_SQL["upsert_session"], (
+            session.acp_session_id,
+            session.agent_name,
+            session.zed_session_id,
+            session.working_directory,
+            now_us,
+            now_us,
+            session.is_active,
+            _dumps(session.metadata) if session.metadata else None
+        )))
+        self._invalidate_session(acp_session_id)
+
+        return session
+
+    async def create_acp_sessions(
+        self,
+        sessions: Sequence[Tuple[str, str, str, str]]
+    ) -> List[ACPSession]:
+        """Create several ACP session records in one transaction.
+
+        ``sessions`` holds ``(acp_session_id, agent, cwd, zed_session_id)`` tuples.
+        """
+        now_us = _now_epoch_us()
+        now = _from_epoch_us(now_us)
+        created = [
+            ACPSession(
+                acp_session_id=acp_session_id,
+                agent_name=agent,
+                zed_session_id=zed_session_id,
+                working_directory=cwd,
+                created_at=now,
+                updated_at=now
+            )
+            for acp_session_id, agent, cwd, zed_session_id in sessions
+        ]
+
+        rows = [
+            (
                 session.acp_session_id,
                 session.agent_name,
                 session.zed_session_id,
                 session.working_directory,
-                session.created_at.isoformat(),
-                session.updated_at.isoformat(),
+                now_us,
+                now_us,
                 session.is_active,
-                json.dumps(session.metadata) if session.metadata else None
-            ))
-            conn.commit()
+                None
+            )
+            for session in created
+        ]
+        await self._run_writer(self._write_many_sync, _SQL["upsert_session"], rows)
+        for session in created:
+            self._invalidate_session(session.acp_session_id)
 
-        return session
+        return created
 
     async def get_acp_session(self, acp_session_id: str) -> Optional[ACPSession]:
         """Retrieve an ACP session by ID."""
-        with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM acp_sessions WHERE acp_session_id = ?
-            """, (acp_session_id,))
-
-            row = cursor.fetchone()
-            if row:
-                return ACPSession.from_dict(dict(row))
+        cached = self._session_cache.get(acp_session_id)
+        if cached is not None:
+            self._session_cache.move_to_end(acp_session_id)
+            self.session_cache_hits += 1
+            return cached
+
+        self.session_cache_misses += 1
+        generation = (self._session_cache_epoch, self._session_generations.get(acp_session_id, 0))
+        await self._flush_touches()
+        rows = await self._fetch(_SQL["get_session"], (acp_session_id,))
+        if not rows:
             return None
 
+        session = ACPSession.from_row(rows[0])
+        # A write that landed during the fetch may have made the row stale
+        current = (self._session_cache_epoch, self._session_generations.get(acp_session_id, 0))
+        if self._session_cache_size and current == generation:
+            self._session_cache[acp_session_id] = session
+            if len(self._session_cache) > self._session_cache_size:
+                self._session_cache.popitem(last=False)
+        return session
+
     async def update_zed_session_id(
         self,
         acp_session_id: str,
         zed_session_id: str
     ) -> None:
         """Update the ZedACP session ID for an ACP session."""
-        with self._get_connection() as conn:
-            conn.execute("""
-                UPDATE acp_sessions
-                SET zed_session_id = ?, updated_at = ?
-                WHERE acp_session_id = ?
-            """, (zed_session_id, datetime.utcnow().isoformat(), acp_session_id))
-            conn.commit()
+        await self._write(
+            (_SQL["update_zed_session_id"], (zed_session_id, _now_epoch_us(), acp_session_id))
+        )
+        self._invalidate_session(acp_session_id)
+
+    async def touch_acp_session(self, acp_session_id: str) -> None:
+        """Bump a session's ``updated_at`` with a single UPDATE."""
+        now_us = _now_epoch_us()
+        await self._write((_SQL["touch_session"], (now_us, acp_session_id)))
+        self._refresh_cached_timestamp(acp_session_id, now_us)
+
+    async def update_session_activity(self, acp_session_id: str, run_id: str) -> None:
+        """Update a session's last activity timestamp and run ID."""
+        await self._write(
+            (_SQL["update_session_activity"], (_now_epoch_us(), run_id, acp_session_id))
+        )
+        self._invalidate_session(acp_session_id)
+
+    @staticmethod
+    def _history_row(
+        acp_session_id: str,
+        run_id: str,
+        message: Message,
+        sequence_number: int,
+        zed_message: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Any, ...]:
+        """Build an ``insert_history`` parameter tuple."""
+        return (
+            acp_session_id,
+            run_id,
+            # Determine role from message (this is a simplified approach)
+            # In practice, the role should be determined by the context of the run
+            # For now, we'll use a simple heuristic based on sequence number
+            "user" if sequence_number == 0 else "assistant",
+            # pydantic-core serializes the message straight to JSON bytes
+            message.model_dump_json(exclude_none=True).encode(),
+            _now_epoch_us(),
+            sequence_number,
+            _dumps_blob(zed_message) if zed_message else None
+        )
 
     async def append_message_history(
         self,
@@ -221,68 +734,105 @@ class SessionDatabase:
         run_id: str,
         message: Message,
         sequence_number: int,
-        zed_message: Optional[Dict[str, Any]] = None
+        zed_message: Optional[Dict[str, Any]] = None,
+        touch_session: bool = False
     ) -> None:
-        """Append a message to session history."""
-        # Determine role from message (this is a simplified approach)
-        # In practice, the role should be determined by the context of the run
-        # For now, we'll use a simple heuristic based on sequence number
-        message_role = "user" if sequence_number == 0 else "assistant"
-
-        history_entry = SessionHistory(
-            id=None,
-            acp_session_id=acp_session_id,
-            run_id=run_id,
-            message_role=message_role,
-            message_data={
-                "role": message.role,
-                "content": [{"type": part.type, "text": part.text} for part in message.content]
-            },
-            created_at=datetime.utcnow(),
-            sequence_number=sequence_number,
-            zed_message_data=zed_message
-        )
+        """Append a message to session history.
 
-        with self._get_connection() as conn:
-            conn.execute("""
-                INSERT INTO session_history
-                (acp_session_id, run_id, message_role, message_data, created_at,
-                 sequence_number, zed_message_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                history_entry.acp_session_id,
-                history_entry.run_id,
-                history_entry.message_role,
-                json.dumps(history_entry.message_data),
-                history_entry.created_at.isoformat(),
-                history_entry.sequence_number,
-                json.dumps(history_entry.zed_message_data) if history_entry.zed_message_data else None
-            ))
-            conn.commit()
+        With ``touch_session`` the session's ``updated_at`` is bumped in the same
+        transaction that writes the buffered row.
+        """
+        self._history_buffer.append(
+            self._history_row(acp_session_id, run_id, message, sequence_number, zed_message)
+        )
+        if touch_session:
+            now_us = _now_epoch_us()
+            self._pending_touches[acp_session_id] = now_us
+            self._refresh_cached_timestamp(acp_session_id, now_us)
+
+        if len(self._history_buffer) >= self._history_batch_size:
+            await self.flush_history()
+        elif self._history_flush_task is None:
+            self._history_flush_task = asyncio.create_task(self._flush_history_later())
+
+    async def _flush_touches(self) -> None:
+        """Flush buffered history if it carries session timestamps a query depends on."""
+        if self._pending_touches:
+            await self.flush_history()
+
+    async def _flush_history_later(self) -> None:
+        """Flush buffered history once the flush interval has elapsed."""
+        await asyncio.sleep(self._history_flush_interval)
+        self._history_flush_task = None
+        pending = len(self._history_buffer)
+        try:
+            await self.flush_history()
+        except Exception:
+            # Nobody awaits this task, so report the loss here rather than as an
+            # unretrieved task exception. The rows are not re-buffered: the
+            # per-row fallback may already have written some of them.
+            logger.exception("Background history flush failed", extra={"dropped_rows": pending})
+
+    async def flush_history(self) -> None:
+        """Write all buffered history rows to the database in a single transaction."""
+        rows, updates = self._take_pending_history()
+        if not rows and not updates:
+            return
+        await self._run_writer(self._insert_history_sync, rows, updates)
+
+    async def record_run(
+        self,
+        acp_session_id: str,
+        run_id: str,
+        messages: Sequence[Message],
+    ) -> None:
+        """Store a run's messages and mark session activity in a single transaction.
+
+        ``messages`` are numbered from 0 in order. Any history still buffered by
+        :meth:`append_message_history` is written ahead of them in the same
+        transaction, so row order matches call order.
+        """
+        rows, updates = self._take_pending_history()
+        rows.extend(
+            self._history_row(acp_session_id, run_id, message, sequence_number)
+            for sequence_number, message in enumerate(messages)
+        )
+        updates.append((_SQL["update_session_activity"], (_now_epoch_us(), run_id, acp_session_id)))
+        await self._run_writer(self._insert_history_sync, rows, updates)
+        self._invalidate_session(acp_session_id)
 
     async def get_session_history(
         self,
         acp_session_id: str,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        include_payload: bool = True,
+        after_id: Optional[int] = None
     ) -> List[SessionHistory]:
-        """Retrieve message history for a session."""
-        with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
-            query = """
-                SELECT * FROM session_history
-                WHERE acp_session_id = ?
-                ORDER BY sequence_number ASC
-            """
-            params = [acp_session_id]
-
-            if limit:
-                query += " LIMIT ?"
-                params.append(str(limit))
-
-            cursor = conn.execute(query, params)
-            rows = cursor.fetchall()
-
-            return [SessionHistory.from_dict(dict(row)) for row in rows]
+        """
+        Retrieve message history for a session in insertion order.
+
+        Pages are fetched with keyset pagination: pass the ``id`` of the last
+        entry already seen as ``after_id`` to continue from there. Sequence
+        numbers restart with every run, so the history row ID is the cursor.
+
+        With ``include_payload=False`` the message payload columns are neither
+        read nor decoded, leaving ``message_data`` empty on the returned entries.
+        """
+        await self.flush_history()
+        key = "get_history" if include_payload else "get_history_summary"
+        cursor = after_id if after_id is not None else -1
+        if limit:
+            rows = await self._fetch(_SQL[f"{key}_limit"], (acp_session_id, cursor, limit))
+        else:
+            rows = await self._fetch(_SQL[key], (acp_session_id, cursor))
+
+        return [SessionHistory.from_row(row, include_payload) for row in rows]
+
+    async def count_session_history(self, acp_session_id: str) -> int:
+        """Count all history entries of a session, regardless of paging."""
+        await self.flush_history()
+        rows = await self._fetch(_SQL["count_history"], (acp_session_id,))
+        return rows[0][0]
 
     async def list_acp_sessions(
         self,
@@ -290,50 +840,82 @@ class SessionDatabase:
         active_only: bool = True
     ) -> List[ACPSession]:
         """List ACP sessions with optional filtering."""
-        with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
-            query = "SELECT * FROM acp_sessions WHERE 1=1"
-            params = []
-
-            if agent_name:
-                query += " AND agent_name = ?"
-                params.append(agent_name)
-
-            if active_only:
-                query += " AND is_active = 1"
+        await self._flush_touches()
+        key = "list_sessions"
+        params: tuple = ()
+        if agent_name:
+            key += "_by_agent"
+            params = (agent_name,)
+        if active_only:
+            key += "_active"
 
-            query += " ORDER BY updated_at DESC"
+        rows = await self._fetch(_SQL[key], params)
 
-            cursor = conn.execute(query, params)
-            rows = cursor.fetchall()
+        return [ACPSession.from_row(row) for row in rows]
 
-            return [ACPSession.from_dict(dict(row)) for row in rows]
+    async def list_acp_session_ids(
+        self,
+        agent_name: Optional[str] = None,
+        active_only: bool = True
+    ) -> List[Tuple[str, str, datetime]]:
+        """List ``(acp_session_id, agent_name, updated_at)`` tuples without loading full sessions."""
+        await self._flush_touches()
+        key = "list_session_ids"
+        params: tuple = ()
+        if agent_name:
+            key += "_by_agent"
+            params = (agent_name,)
+        if active_only:
+            key += "_active"
+
+        rows = await self._fetch(_SQL[key], params)
+
+        return [
+            (row[0], row[1], _from_epoch_us(row[2]))
+            for row in rows
+        ]
 
     async def delete_acp_session(self, acp_session_id: str) -> bool:
         """Delete an ACP session and all its history."""
-        with self._get_connection() as conn:
+        await self.flush_history()
+        deleted = await self._write(
             # Delete session history first (foreign key constraint)
-            conn.execute("DELETE FROM session_history WHERE acp_session_id = ?", (acp_session_id,))
-
+            (_SQL["delete_history"], (acp_session_id,)),
             # Delete the session
-            cursor = conn.execute("DELETE FROM acp_sessions WHERE acp_session_id = ?", (acp_session_id,))
-            conn.commit()
-
-            return cursor.rowcount > 0
+            (_SQL["delete_session"], (acp_session_id,)),
+        )
+        self._invalidate_session(acp_session_id)
+        return deleted > 0
 
     async def cleanup_inactive_sessions(self, days_old: int = 30) -> int:
         """Clean up old inactive sessions. Returns number of sessions deleted."""
-        cutoff_date = datetime.utcnow().isoformat()
-        with self._get_connection() as conn:
-            cursor = conn.execute("""
-                DELETE FROM acp_sessions
-                WHERE is_active = 0 AND updated_at < datetime(?, '-' || ? || ' days')
-            """, (cutoff_date, days_old))
-            deleted_count = cursor.rowcount
-            conn.commit()
-            return deleted_count
+        await self._flush_touches()
+        cutoff_date = _now_epoch_us() - days_old * _MICROSECONDS_PER_DAY
+        deleted_count = await self._write((_SQL["cleanup_inactive_sessions"], (cutoff_date,)))
+        self._session_cache.clear()
+        self._session_cache_epoch += 1
+        return deleted_count
+
+    async def aclose(self) -> None:
+        """Close from the event loop without blocking it.
+
+        Waits for an in-flight write, then flushes buffered history and closes
+        the connections on a worker thread.
+        """
+        if self._history_flush_task is not None:
+            self._history_flush_task.cancel()
+            self._history_flush_task = None
+        await self._run_writer(self.close)
 
     def close(self) -> None:
-        """Close all database connections."""
-        if hasattr(self._local, 'connection'):
-            self._local.connection.close()
\ No newline at end of file
+        """Flush buffered history and close all database connections."""
+        if self._history_flush_task is not None:
+            with suppress(RuntimeError):  # event loop already closed
+                self._history_flush_task.cancel()
+            self._history_flush_task = None
+        rows, updates = self._take_pending_history()
+        if rows or updates:
+            self._insert_history_sync(rows, updates)
+        connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
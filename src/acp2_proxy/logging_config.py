@@ -1,18 +1,31 @@
 from __future__ import annotations
 
-import json
 import logging
 import os
 from datetime import datetime, timezone
 from typing import Any, Dict
 
+import orjson
+
 
 class JsonFormatter(logging.Formatter):
     """Format log records as structured JSON."""
 
+    # Second-resolution prefix of the last formatted timestamp; records logged
+    # within the same wall-clock second only need their microseconds appended.
+    _last_second: int = -1
+    _last_prefix: str = ""
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._last_second:
+            self._last_prefix = datetime.fromtimestamp(second, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            self._last_second = second
+        return f"{self._last_prefix}.{int((created - second) * 1_000_000):06d}+00:00"
+
     def format(self, record: logging.LogRecord) -> str:  # noqa: D401
         payload: Dict[str, Any] = {
-            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -28,13 +41,20 @@ class JsonFormatter(logging.Formatter):
                 continue
             if key in {"msg", "args"}:
                 continue
-            try:
-                json.dumps(value)
-                payload[key] = value
-            except (TypeError, ValueError):
-                payload[key] = repr(value)
+            payload[key] = value
 
-        return json.dumps(payload, separators=(",", ":"))
+        # Values orjson cannot encode fall back to repr() via ``default``.
+        try:
+            return orjson.dumps(payload, default=repr, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # ``default`` never sees ints wider than 64 bits or unsupported
+            # dict keys; probe each field so one bad value doesn't lose the record.
+            for key, value in payload.items():
+                try:
+                    orjson.dumps(value, default=repr, option=orjson.OPT_NON_STR_KEYS)
+                except TypeError:
+                    payload[key] = repr(value)
+            return orjson.dumps(payload, default=repr, option=orjson.OPT_NON_STR_KEYS).decode()
 
 
 def configure_logging() -> None:
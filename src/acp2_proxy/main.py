@@ -1,45 +1,93 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import hmac
 import logging
-import os
 from contextlib import asynccontextmanager, suppress
-from typing import Any, AsyncGenerator, Optional, List, Dict
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
-from fastapi.responses import Response, StreamingResponse
-from fastapi.encoders import jsonable_encoder
+from fastapi import Depends, FastAPI, Header, HTTPException, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
+from pydantic import BaseModel
+import orjson
 
+from .agent_pool import AgentConnectionPool
 from .agent_registry import AgentRegistry
-from .database import SessionDatabase
+from .database import ACPSession, SessionDatabase
 from .logging_config import configure_logging
-from .models import AgentManifest, AgentSummary, Run, RunCreateRequest, RunMode, RunStatus, Message, MessagePart
+from .models import AgentConfig, AgentManifest, AgentSummary, Run, RunCreateRequest, RunMode, RunStatus, Message
 from .run_manager import RunManager
 from .session_manager import SessionManager
 from .settings import get_settings
+from .sse import SSEBuffer, SSEResponse
 from .zed_agent import AgentProcessError, PromptCancelled, ZedAgentConnection
 
 logger = logging.getLogger(__name__)
 
 
+# Shared empty MCP server list passed to every session/new and session/load.
+_EMPTY_MCP: tuple = ()
+
+# Runs whose SSE client disconnected, and pending coalesced-text flushes, keep a
+# strong reference here until they finish.
+_background_tasks: set[asyncio.Task[None]] = set()
+
+_SSE_PREFIX = {
+    name: f"event: {name}\ndata: ".encode("utf-8")
+    for name in ("run.started", "run.completed", "run.cancelled", "run.failed", "message.part")
+}
+
+
+def _json_default(value: Any) -> Any:
+    """orjson fallback for pydantic models nested inside plain payloads."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _sse_prefix(event: str) -> bytes:
+    return _SSE_PREFIX.get(event) or f"event: {event}\ndata: ".encode("utf-8")
+
+
+def encode_sse_data(data: Any) -> bytes:
+    """Encode an SSE data payload as JSON bytes.
+
+    Pydantic models are serialized by pydantic-core straight to bytes; other
+    payloads go through orjson.
+    """
+    if isinstance(data, BaseModel):
+        return data.__pydantic_serializer__.to_json(data)
+    return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
 def format_sse(event: str, data: Any) -> bytes:
     """Serialize data as a server-sent event."""
-    encoded = jsonable_encoder(data)
-    return f"event: {event}\ndata: {json.dumps(encoded)}\n\n".encode("utf-8")
+    return _sse_prefix(event) + encode_sse_data(data) + b"\n\n"
 
 
-def require_authorization(authorization: Optional[str] = Header(default=None)) -> None:
-    """FastAPI dependency enforcing bearer token authentication."""
-    settings = get_settings()
-    token = settings.auth_token
+_BEARER = "Bearer "
+
+
+def auth_dependencies(token: Optional[str]) -> list[Any]:
+    """Return route dependencies enforcing bearer authentication for ``token``.
+
+    With no token configured nothing is registered, so FastAPI has no
+    dependency to resolve per request.
+    """
     if not token:
-        return
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
-    provided = authorization.split(" ", 1)[1]
-    if provided != token:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid bearer token")
+        return []
+    expected = token.encode("utf-8")
+
+    def require_authorization(authorization: Optional[str] = Header(default=None)) -> None:
+        """FastAPI dependency enforcing bearer token authentication."""
+        if authorization is None or len(authorization) <= 7 or authorization[:7] != _BEARER:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
+        if not hmac.compare_digest(authorization[7:].encode("utf-8"), expected):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid bearer token")
+
+    return [Depends(require_authorization)]
 
 
 @asynccontextmanager
@@ -49,92 +97,261 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Initialize components
     app.state.registry = AgentRegistry()
     app.state.run_manager = RunManager()
+    # The registry is static while the app runs, so its responses are encoded once
+    app.state.agent_responses = build_agent_responses(app.state.registry)
 
-    # Load agent configuration
-    config_path = os.path.join(os.path.dirname(__file__), "..", "..", "config", "agents.json")
-    with open(config_path, 'r') as f:
-        agent_config = json.load(f)
+    # Pre-start agent processes so runs skip the spawn and initialize handshake
+    settings = get_settings()
+    app.state.connection_pool = AgentConnectionPool(
+        settings.agent_pool_size, settings.session_keepalive_s, settings.session_keepalive_max
+    )
+    app.state.connection_pool.warm(app.state.registry.list())
+    # Working directory for stateless runs and newly created sessions
+    app.state.default_cwd = settings.default_cwd
+    app.state.stream_coalesce_s = settings.stream_coalesce_ms / 1000
 
     # Initialize database and session manager
-    app.state.database = SessionDatabase()
-    app.state.session_manager = SessionManager(app.state.database, agent_config)
+    app.state.database = SessionDatabase(
+        settings.db_path,
+        read_pool_size=settings.db_read_pool_size,
+        history_batch_size=settings.history_batch_size,
+        history_flush_ms=settings.history_flush_ms,
+    )
+    # Share the registry's already-validated agent configuration
+    app.state.session_manager = SessionManager(app.state.database, app.state.registry.configs())
+    # History writes scheduled after a streamed run.completed frame
+    app.state.persistence_tasks = set()
 
     logger.info("ACP² proxy initialized with stateful session support")
     yield
 
     # Cleanup
-    app.state.database.close()
+    await app.state.connection_pool.close()
+    if app.state.persistence_tasks:
+        await asyncio.gather(*app.state.persistence_tasks)
+    await app.state.database.aclose()
     logger.info("ACP² proxy shutdown")
 
 
-def get_registry(request: Request) -> AgentRegistry:
-    return request.app.state.registry
+@dataclass(frozen=True)
+class AgentResponses:
+    """Pre-encoded responses for the read-only agent endpoints."""
 
+    summary: Response
+    manifests: Dict[str, Response]
 
-def get_run_manager(request: Request) -> RunManager:
-    return request.app.state.run_manager
 
+def _json_response(content: Any) -> Response:
+    return Response(content=orjson.dumps(content), media_type="application/json")
 
-def get_session_manager(request: Request) -> SessionManager:
-    return request.app.state.session_manager
 
+def _model_response(model: BaseModel) -> Response:
+    """JSON response serialized by pydantic-core straight to bytes."""
+    return Response(content=model.__pydantic_serializer__.to_json(model), media_type="application/json")
 
-def get_database(request: Request) -> SessionDatabase:
-    return request.app.state.database
 
+def build_agent_responses(registry: AgentRegistry) -> AgentResponses:
+    """Encode the agent listing and manifests once; rebuild after reloading the registry."""
+    agents = list(registry.list())
+    summary = _json_response([
+        AgentSummary(name=agent.name, description=agent.description).model_dump(mode="json")
+        for agent in agents
+    ])
+    manifests = {
+        agent.name: _json_response(registry.manifest_for(agent.name).model_dump(mode="json"))
+        for agent in agents
+    }
+    return AgentResponses(summary=summary, manifests=manifests)
 
 
+async def _open_session(
+    connection: ZedAgentConnection,
+    run: Run,
+    session_manager: SessionManager,
+    acp_session: Optional[ACPSession],
+    default_cwd: str,
+) -> str:
+    """Load or create the ZedACP session backing a run and return its ID."""
+    if acp_session is None:
+        # Stateless run - create new session
+        return await connection.start_session(cwd=default_cwd, mcp_servers=_EMPTY_MCP)
+
+    if acp_session.zed_session_id:
+        # Load existing ZedACP session for true stateful behavior
+        try:
+            await connection.load_session(
+                acp_session.zed_session_id,
+                acp_session.working_directory,
+                _EMPTY_MCP  # MCP servers for now
+            )
+            logger.debug("Loaded existing ZedACP session", extra={
+                "run_id": run.id,
+                "acp_session_id": acp_session.acp_session_id,
+                "zed_session_id": acp_session.zed_session_id
+            })
+            return acp_session.zed_session_id
+        except Exception as e:
+            logger.warning("Failed to load ZedACP session, creating new", extra={
+                "run_id": run.id,
+                "acp_session_id": acp_session.acp_session_id,
+                "error": str(e)
+            })
+
+    # Create new ZedACP session for ACP session and update the mapping
+    session_id = await connection.start_session(
+        cwd=acp_session.working_directory,
+        mcp_servers=_EMPTY_MCP
+    )
+    await session_manager.db.update_zed_session_id(acp_session.acp_session_id, session_id)
+    logger.debug("Created new ZedACP session for ACP session", extra={
+        "run_id": run.id,
+        "acp_session_id": acp_session.acp_session_id,
+        "zed_session_id": session_id
+    })
+    return session_id
+
+
+async def _execute_prompt(
+    agent: AgentConfig,
+    run: Run,
+    prompt_content: list[dict[str, Any]],
+    pool: AgentConnectionPool,
+    manager: RunManager,
+    session_manager: SessionManager,
+    acp_session: Optional[ACPSession],
+    cancel_event: asyncio.Event,
+    default_cwd: str,
+    on_chunk: Callable[[str], Awaitable[None]],
+    on_started: Optional[Callable[[], Awaitable[None]]] = None,
+) -> tuple[Optional[dict[str, Any]], bool]:
+    """Run one prompt on an initialized agent process from the connection pool.
+
+    Returns the prompt result and whether the run was cancelled. Shared by the
+    sync and streaming branches of ``POST /runs``.
+    """
+    session_id: Optional[str] = None
+    if acp_session is not None:
+        # A process kept from the session's previous run already has it loaded
+        connection, session_id = await pool.checkout_session(agent, acp_session.acp_session_id)
+    else:
+        connection = await pool.checkout(agent)
+    reusable = False
+    try:
+        await manager.start_run(run.id, connection)
+        if on_started is not None:
+            await on_started()
+
+        if session_id is None:
+            session_id = await _open_session(connection, run, session_manager, acp_session, default_cwd)
+        await manager.set_session_id(run.id, session_id)
+
+        # connection.prompt races the cancel event itself and notifies the agent
+        # with session/cancel when it fires, so there is nothing else to await here
+        result: dict[str, Any] | None = None
+        cancelled = False
+        try:
+            result = await connection.prompt(
+                session_id, prompt_content, on_chunk=on_chunk, cancel_event=cancel_event
+            )
+        except PromptCancelled:
+            cancelled = True
+
+        # Cancellation may also have been requested after the agent completed
+        cancelled = cancelled or cancel_event.is_set()
+        # Only a cleanly finished prompt leaves the process fit for the next run
+        reusable = not cancelled
+        return result, cancelled
+    finally:
+        if reusable and acp_session is not None:
+            pool.checkin(connection, agent, acp_session.acp_session_id, session_id)
+        else:
+            pool.checkin(connection)
+
+
+async def _complete_run(
+    run: Run,
+    result: Optional[dict[str, Any]],
+    manager: RunManager,
+) -> Run:
+    """Mark a run completed with the stop reason reported by the agent."""
+    result = result or {}
+    stop_reason = result.get("stopReason") if isinstance(result, dict) else None
+    return await manager.complete_run(run.id, stop_reason)
+
+
+async def _persist_run(
+    session_manager: SessionManager,
+    acp_session: ACPSession,
+    run: Run,
+    user_message: Message,
+) -> None:
+    """Store a completed run's exchange in the session history, logging failures."""
+    try:
+        await session_manager.finalize_run(acp_session.acp_session_id, run.id, user_message, run.output)
+    except Exception:
+        logger.exception("Failed to persist session history", extra={
+            "run_id": run.id,
+            "acp_session_id": acp_session.acp_session_id,
+        })
+
 
 def create_app() -> FastAPI:
     """Application factory."""
     app = FastAPI(title="ACP² Proxy Server", version="0.1.0", lifespan=lifespan)
+    # Session listings and history compress well; GZipMiddleware leaves
+    # text/event-stream alone so SSE frames are never held back.
+    app.add_middleware(GZipMiddleware, minimum_size=512)
+    auth = auth_dependencies(get_settings().auth_token)
+    # Components are created by the lifespan; handlers read them straight off
+    # app.state instead of resolving a dependency per request.
+    state = app.state
+
+    pong = _json_response({"status": "ok"})
 
-    @app.get("/ping", dependencies=[Depends(require_authorization)])
-    async def ping() -> dict[str, str]:
-        return {"status": "ok"}
+    @app.get("/ping", dependencies=auth)
+    async def ping() -> Response:
+        return pong
 
     @app.get(
         "/agents",
         response_model=list[AgentSummary],
-        dependencies=[Depends(require_authorization)],
+        dependencies=auth,
     )
-    async def list_agents(registry: AgentRegistry = Depends(get_registry)) -> list[AgentSummary]:
-        agents = [
-            AgentSummary(name=agent.name, description=agent.description)
-            for agent in registry.list()
-        ]
-        return agents
+    async def list_agents() -> Response:
+        return state.agent_responses.summary
 
     @app.get(
         "/agents/{name}",
         response_model=AgentManifest,
-        dependencies=[Depends(require_authorization)],
+        dependencies=auth,
     )
-    async def agent_manifest(name: str, registry: AgentRegistry = Depends(get_registry)) -> AgentManifest:
+    async def agent_manifest(name: str) -> Response:
         try:
-            return registry.manifest_for(name)
+            return state.agent_responses.manifests[name]
         except KeyError:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Agent not found") from None
 
     @app.post(
         "/runs",
-        dependencies=[Depends(require_authorization)],
+        dependencies=auth,
     )
 
     async def create_run_endpoint(
         payload: RunCreateRequest,
-        registry: AgentRegistry = Depends(get_registry),
-        manager: RunManager = Depends(get_run_manager),
-        session_manager: SessionManager = Depends(get_session_manager),
     ):
+        registry: AgentRegistry = state.registry
+        manager: RunManager = state.run_manager
+        session_manager: SessionManager = state.session_manager
+        pool: AgentConnectionPool = state.connection_pool
         try:
             agent = registry.get(payload.agent)
         except KeyError:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Agent not found") from None
 
         run = await manager.create_run(agent.name, payload.mode)
+        cancel_event = await manager.cancel_event_for(run.id)
         # Convert input content to structured content blocks
-        prompt_content = [{"type": "text", "text": part.text} for part in payload.input.content]
+        prompt_content = payload.input.prompt_blocks()
 
         # Handle stateful sessions
         acp_session = None
@@ -143,7 +360,7 @@ def create_app() -> FastAPI:
             active_session = await session_manager.get_or_create_session(
                 payload.session_id,
                 agent.name,
-                os.getcwd()  # Use current working directory or allow override
+                state.default_cwd
             )
             acp_session = active_session.acp_session
             logger.info("Using stateful session", extra={
@@ -153,344 +370,158 @@ def create_app() -> FastAPI:
             })
 
         if payload.mode == RunMode.sync:
-            try:
-                async with ZedAgentConnection(agent.command, api_key=agent.api_key) as connection:
-                    await manager.start_run(run.id, connection)
-
-                    # Initialize ZedACP connection
-                    await connection.initialize()
-
-                    # Handle session persistence
-                    if acp_session and acp_session.zed_session_id:
-                        # Load existing ZedACP session for true stateful behavior
-                        try:
-                            await connection.load_session(
-                                acp_session.zed_session_id,
-                                acp_session.working_directory,
-                                []  # MCP servers for now
-                            )
-                            session_id = acp_session.zed_session_id
-                            logger.debug("Loaded existing ZedACP session", extra={
-                                "run_id": run.id,
-                                "acp_session_id": payload.session_id,
-                                "zed_session_id": session_id
-                            })
-                        except Exception as e:
-                            logger.warning("Failed to load ZedACP session, creating new", extra={
-                                "run_id": run.id,
-                                "acp_session_id": payload.session_id,
-                                "error": str(e)
-                            })
-                            # Fallback to new session if load fails
-                            session_id = await connection.start_session(
-                                cwd=acp_session.working_directory,
-                                mcp_servers=[]
-                            )
-                            # Update mapping with new ZedACP session ID
-                            if payload.session_id:
-                                await session_manager.db.update_zed_session_id(
-                                    payload.session_id, session_id
-                                )
-                    elif acp_session:
-                        # Create new ZedACP session for ACP session
-                        session_id = await connection.start_session(
-                            cwd=acp_session.working_directory,
-                            mcp_servers=[]
-                        )
-                        # Update mapping with new ZedACP session ID
-                        if payload.session_id:
-                            await session_manager.db.update_zed_session_id(
-                                payload.session_id, session_id
-                            )
-                        logger.debug("Created new ZedACP session for ACP session", extra={
-                            "run_id": run.id,
-                            "acp_session_id": payload.session_id,
-                            "zed_session_id": session_id
-                        })
-                    else:
-                        # Stateless run - create new session
-                        session_id = await connection.start_session(cwd="/Users/origo/src/acp2", mcp_servers=[])
-
-                    await manager.set_session_id(run.id, session_id)
-                    cancel_event = await manager.cancel_event_for(run.id)
-
-                    async def on_chunk(text: str) -> None:
-                        await manager.append_output_part(run.id, text)
-                    logger.debug("About to call connection.prompt with cancel_event", extra={"run_id": run.id, "cancel_event_is_set": cancel_event.is_set()})
-                    prompt_task = asyncio.create_task(
-                        connection.prompt(session_id, prompt_content, on_chunk=on_chunk, cancel_event=cancel_event)
-                    )
-                    cancel_wait = asyncio.create_task(cancel_event.wait())
-                    done, pending = await asyncio.wait(
-                        {prompt_task, cancel_wait},
-                        return_when=asyncio.FIRST_COMPLETED,
-                    )
-
-                    cancelled = cancel_wait in done or cancel_event.is_set()
-                    result: dict[str, Any] | None = None
-
-                    if prompt_task in done:
-                        try:
-                            result = prompt_task.result()
-                        except PromptCancelled:
-                            cancelled = True
-                        except AgentProcessError:
-                            raise
-
-                    # Cancel remaining tasks safely, handling different return types
-                    for task in pending:
-                        if not task.done():
-                            task.cancel()
-                            try:
-                                await task
-                            except asyncio.CancelledError:
-                                pass
-
-                    if cancelled:
-                        if not prompt_task.done():
-                            prompt_task.cancel()
-                            await asyncio.gather(prompt_task, return_exceptions=True)
-                            try:
-                                await connection.cancel(session_id)
-                            except AgentProcessError:
-                                logger.warning("Failed to send cancellation to agent", extra={"run_id": run.id})
-                        else:
-                            await asyncio.gather(prompt_task, return_exceptions=True)
-                        cancelled_run = await manager.cancel_run(run.id)
-                        return cancelled_run
-
-                    cancel_wait.cancel()
-                    await asyncio.gather(cancel_wait, return_exceptions=True)
-
-                    if cancel_event.is_set():
-                        cancelled_run = await manager.cancel_run(run.id)
-                        return cancelled_run
-
-                    result = result or {}
-                    stop_reason = result.get("stopReason") if isinstance(result, dict) else None
-                    completed = await manager.complete_run(run.id, stop_reason)
-
-                    # Store message history for stateful sessions
-                    if payload.session_id and acp_session:
-                        # Store the user input message
-                        await session_manager.append_message_to_history(
-                            acp_session_id=payload.session_id,
-                            run_id=run.id,
-                            message=payload.input,
-                            sequence_number=0  # User message is first
-                        )
-
-                        # Store the assistant response if available
-                        if completed.output:
-                            await session_manager.append_message_to_history(
-                                acp_session_id=payload.session_id,
-                                run_id=run.id,
-                                message=completed.output,
-                                sequence_number=1  # Assistant response is second
-                            )
+            async def on_chunk(text: str) -> None:
+                await manager.append_output_part(run.id, text)
 
-                        # Update session activity
-                        await session_manager.update_session_activity(payload.session_id, run.id)
-
-                    return completed
+            try:
+                result, cancelled = await _execute_prompt(
+                    agent, run, prompt_content, pool, manager, session_manager, acp_session, cancel_event, state.default_cwd, on_chunk
+                )
             except AgentProcessError as exc:  # pragma: no cover - error path
                 logger.exception("Agent process failed during sync run", extra={"run_id": run.id})
                 failed = await manager.fail_run(run.id, str(exc))
                 error_message = failed.error.message if failed.error and failed.error.message else str(exc)
                 raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=error_message)
 
+            if cancelled:
+                return _model_response(await manager.cancel_run(run.id))
+
+            completed = await _complete_run(run, result, manager)
+            if acp_session:
+                await _persist_run(session_manager, acp_session, completed, payload.input)
+            return _model_response(completed)
+
         # streaming mode
         async def event_stream() -> AsyncGenerator[bytes, None]:
-            queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+            buffer = SSEBuffer()
             cancelled_emitted = False
-            cancel_event_ref: asyncio.Event | None = None
-
-            # Track message parts for history storage
-            message_parts = []
+            # Checked once per stream so emits skip building log records when DEBUG is off
+            debug = logger.isEnabledFor(logging.DEBUG)
 
             async def emit(event: str, data: Any) -> None:
-                logger.debug("Emitting SSE", extra={"event": event})
-                if event == "run.started":
-                    logger.info("run.started emitted", extra={"run_id": data["id"] if isinstance(data, dict) and "id" in data else None})
-                # Put the event in queue immediately for real-time streaming
-                await queue.put(format_sse(event, data))
-
-                # Collect message parts for history storage
-                if event == "message.part" and isinstance(data, dict):
-                    part_text = data.get("delta", {}).get("text", "")
-                    if part_text:
-                        message_parts.append(part_text)
+                # Text still waiting in the coalescing window goes out first
+                await flush_parts()
+                if debug:
+                    logger.debug("Emitting SSE", extra={"event": event, "run_id": run.id})
+                # Hand the event to the SSE buffer immediately for real-time streaming
+                await buffer.write_frame(_sse_prefix(event), encode_sse_data(data))
+
+            async def on_started() -> None:
+                await emit("run.started", run)
+
+            # run_id and the framing never change within a run, so only the text
+            # delta is encoded per chunk and spliced between constant bytes
+            part_prefix = (
+                _SSE_PREFIX["message.part"]
+                + b'{"run_id":' + orjson.dumps(run.id) + b',"delta":{"type":"text","text":'
+            )
+            part_suffix = b"}}\n\n"
+
+            # Chunks arriving within the coalescing window are sent as one
+            # message.part; deltas are additive, so clients render the same text.
+            coalesce_s = state.stream_coalesce_s
+            pending_text: list[str] = []
+            flush_handle: Optional[asyncio.TimerHandle] = None
+
+            async def flush_parts() -> None:
+                nonlocal flush_handle
+                if flush_handle is not None:
+                    flush_handle.cancel()
+                    flush_handle = None
+                if pending_text:
+                    text = "".join(pending_text)
+                    pending_text.clear()
+                    await buffer.write_frame(part_prefix, orjson.dumps(text), part_suffix)
+
+            def schedule_flush() -> None:
+                nonlocal flush_handle
+                flush_handle = None
+                task = asyncio.create_task(flush_parts())
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+
+            async def on_chunk(text: str) -> None:
+                nonlocal flush_handle
+                await manager.append_output_part(run.id, text)
+                if not coalesce_s:
+                    await buffer.write_frame(part_prefix, orjson.dumps(text), part_suffix)
+                    return
+                pending_text.append(text)
+                if flush_handle is None:
+                    flush_handle = asyncio.get_running_loop().call_later(coalesce_s, schedule_flush)
 
             async def process_agent() -> None:
-                nonlocal cancelled_emitted, cancel_event_ref
+                nonlocal cancelled_emitted
                 try:
-                    async with ZedAgentConnection(agent.command, api_key=agent.api_key) as connection:
-                        await manager.start_run(run.id, connection)
-                        logger.info("process_agent before run.started", extra={"run_id": run.id})
-                        await emit("run.started", run.model_dump(mode="json"))
-                        logger.info("process_agent after run.started", extra={"run_id": run.id})
-                        await connection.initialize()
-                        session_id = await connection.start_session(cwd="/Users/origo/src/acp2", mcp_servers=[])
-                        await manager.set_session_id(run.id, session_id)
-                        cancel_event = await manager.cancel_event_for(run.id)
-                        cancel_event_ref = cancel_event
-
-                        async def on_chunk(text: str) -> None:
-                            await manager.append_output_part(run.id, text)
-                            await emit(
-                                "message.part",
-                                {"run_id": run.id, "delta": {"type": "text", "text": text}},
-                            )
-
-                        prompt_task = asyncio.create_task(
-                            connection.prompt(session_id, prompt_content, on_chunk=on_chunk, cancel_event=cancel_event)
-                        )
-
-                        cancel_wait = asyncio.create_task(cancel_event.wait())
-
-                        try:
-                            done, pending = await asyncio.wait(
-                                {prompt_task, cancel_wait},
-                                return_when=asyncio.FIRST_COMPLETED,
+                    result, cancelled = await _execute_prompt(
+                        agent, run, prompt_content, pool, manager, session_manager, acp_session,
+                        cancel_event, state.default_cwd, on_chunk, on_started=on_started,
+                    )
+                    if cancelled:
+                        cancelled_run = await manager.cancel_run(run.id)
+                        await emit("run.cancelled", cancelled_run)
+                        cancelled_emitted = True
+                    else:
+                        completed = await _complete_run(run, result, manager)
+                        await emit("run.completed", completed)
+                        if acp_session:
+                            # The client already has the result; history is
+                            # written concurrently and awaited at shutdown.
+                            task = asyncio.create_task(
+                                _persist_run(session_manager, acp_session, completed, payload.input)
                             )
-
-                            cancelled = cancel_wait in done or cancel_event.is_set()
-                            result: dict[str, Any] | None = None
-
-                            if prompt_task in done:
-                                try:
-                                    result = prompt_task.result()
-                                except PromptCancelled:
-                                    cancelled = True
-                                except AgentProcessError:
-                                    raise
-
-                            # Cancel remaining tasks safely, handling different return types
-                            for task in pending:
-                                if not task.done():
-                                    task.cancel()
-                                    try:
-                                        await task
-                                    except asyncio.CancelledError:
-                                        pass
-
-                            if cancelled:
-                                if not prompt_task.done():
-                                    prompt_task.cancel()
-                                    try:
-                                        await prompt_task
-                                    except asyncio.CancelledError:
-                                        pass
-                                # Always send cancellation to the agent when cancellation is requested
-                                try:
-                                    await connection.cancel(session_id)
-                                except AgentProcessError:
-                                    logger.warning(
-                                        "Failed to send cancellation to agent",
-                                        extra={"run_id": run.id},
-                                    )
-                                cancelled_run = await manager.cancel_run(run.id)
-                                await emit("run.cancelled", cancelled_run.model_dump(mode="json"))
-                                cancelled_emitted = True
-                            else:
-                                if cancel_event.is_set():
-                                    # Cancellation was requested but agent completed first
-                                    cancelled_run = await manager.cancel_run(run.id)
-                                    await emit("run.cancelled", cancelled_run.model_dump(mode="json"))
-                                    cancelled_emitted = True
-                                else:
-                                    result = result or {}
-                                    stop_reason = result.get("stopReason") if isinstance(result, dict) else None
-                                    completed = await manager.complete_run(run.id, stop_reason)
-                                    await emit("run.completed", completed.model_dump(mode="json"))
-
-                                    # Store message history for stateful sessions
-                                    if payload.session_id and acp_session and message_parts:
-                                        # Store the user input message
-                                        await session_manager.append_message_to_history(
-                                            acp_session_id=payload.session_id,
-                                            run_id=run.id,
-                                            message=payload.input,
-                                            sequence_number=0  # User message is first
-                                        )
-
-                                        # Store the assistant response as a single message
-                                        assistant_message = Message(
-                                            role="assistant",
-                                            content=[MessagePart(type="text", text="".join(message_parts))]
-                                        )
-                                        await session_manager.append_message_to_history(
-                                            acp_session_id=payload.session_id,
-                                            run_id=run.id,
-                                            message=assistant_message,
-                                            sequence_number=1  # Assistant response is second
-                                        )
-
-                                        # Update session activity
-                                        await session_manager.update_session_activity(payload.session_id, run.id)
-                        except Exception as e:
-                            logger.exception("Error in prompt processing", extra={"run_id": run.id, "error": str(e)})
-                            raise
+                            state.persistence_tasks.add(task)
+                            task.add_done_callback(state.persistence_tasks.discard)
                 except PromptCancelled:
                     cancelled = await manager.cancel_run(run.id)
-                    await emit("run.cancelled", cancelled.model_dump(mode="json"))
+                    await emit("run.cancelled", cancelled)
                     cancelled_emitted = True
                 except AgentProcessError as exc:
                     logger.exception("Agent process failed during streaming run", extra={"run_id": run.id})
                     failed = await manager.fail_run(run.id, str(exc))
-                    await emit("run.failed", failed.model_dump(mode="json"))
+                    await emit("run.failed", failed)
                 finally:
-                    await queue.put(None)
+                    if flush_handle is not None:
+                        flush_handle.cancel()
+                    buffer.close()
 
             agent_task = asyncio.create_task(process_agent())
             try:
                 # Stream events as they come in - this keeps the connection open
-                while True:
-                    try:
-                        # Wait for events with a timeout to allow for cancellation checks
-                        item = await asyncio.wait_for(queue.get(), timeout=0.1)
-                        if item is None:
-                            break
-                        yield item
-                    except asyncio.TimeoutError:
-                        # Check if we need to handle post-completion cancellation
-                        if agent_task.done():
-                            break
-                        continue
+                async for chunk in buffer:
+                    yield chunk
 
                 # After the agent process is done, check if cancellation was requested
                 # but not yet emitted (handles race condition where cancellation happens
                 # after agent completes but before we check cancel_event)
-                logger.info("Checking for post-completion cancellation", extra={"run_id": run.id, "cancel_event_ref": cancel_event_ref is not None})
-                if cancel_event_ref is None:
-                    cancel_event_ref = await manager.cancel_event_for(run.id)
-                    logger.info("Retrieved cancel_event_ref", extra={"run_id": run.id, "cancel_event_is_set": cancel_event_ref.is_set()})
-                if cancel_event_ref.is_set() and not cancelled_emitted:
+                if cancel_event.is_set() and not cancelled_emitted:
                     logger.info("post-completion cancellation detected", extra={"run_id": run.id})
                     cancelled_run = await manager.cancel_run(run.id)
-                    yield format_sse("run.cancelled", cancelled_run.model_dump(mode="json"))
-                else:
-                    logger.info("No post-completion cancellation", extra={"run_id": run.id, "cancel_event_is_set": cancel_event_ref.is_set(), "cancel_event_id": id(cancel_event_ref)})
+                    # A run that already completed or failed sent its terminal event
+                    if cancelled_run is not None and cancelled_run.status == RunStatus.cancelled:
+                        yield format_sse("run.cancelled", cancelled_run)
             finally:
-                # Clean up the agent task
                 if not agent_task.done():
-                    agent_task.cancel()
-                    try:
-                        await agent_task
-                    except asyncio.CancelledError:
-                        pass
+                    # The client went away before the run finished. Request
+                    # cancellation so the agent stops generating, and let
+                    # process_agent wind the run down on its own; awaiting it
+                    # here would be cancelled again by the server's cancel scope.
+                    cancel_event.set()
+                    buffer.close()
+                    _background_tasks.add(agent_task)
+                    agent_task.add_done_callback(_background_tasks.discard)
 
-        return StreamingResponse(event_stream(), media_type="text/event-stream")
+        return SSEResponse(event_stream())
 
     @app.post(
         "/runs/{run_id}/cancel",
         response_model=Run,
-        dependencies=[Depends(require_authorization)],
+        dependencies=auth,
     )
     async def cancel_run(
         run_id: str,
-        manager: RunManager = Depends(get_run_manager),
-    ) -> Run:
+    ) -> Response:
+        manager: RunManager = state.run_manager
         try:
             run = await manager.get_run(run_id)
         except KeyError:
@@ -498,90 +529,101 @@ def create_app() -> FastAPI:
 
         connection = await manager.connection_for(run_id)
         response_run = await manager.request_cancel(run_id)
-        cancel_event = await manager.cancel_event_for(run_id)
         logger.info(
             "Run marked for cancellation",
-            extra={"run_id": run_id, "has_connection": connection is not None, "cancel_event_set": cancel_event.is_set(), "cancel_event_id": id(cancel_event)},
+            extra={"run_id": run_id, "has_connection": connection is not None, "status": response_run.status},
         )
-        return response_run
+        return _model_response(response_run)
 
     # Session management endpoints
     @app.get(
         "/sessions",
-        dependencies=[Depends(require_authorization)],
+        dependencies=auth,
     )
     async def list_sessions(
         agent_name: Optional[str] = None,
         active_only: bool = True,
-        session_manager: SessionManager = Depends(get_session_manager),
-    ) -> List[Dict[str, Any]]:
+    ) -> Response:
         """List ACP sessions with optional filtering."""
+        session_manager: SessionManager = state.session_manager
         sessions = await session_manager.list_acp_sessions(agent_name, active_only)
-        return [
+        # orjson renders the naive UTC datetimes in the same ISO format as
+        # datetime.isoformat(), without a per-row Python call
+        return _json_response([
             {
                 "session_id": session.acp_session_id,
                 "agent_name": session.agent_name,
                 "zed_session_id": session.zed_session_id,
                 "working_directory": session.working_directory,
-                "created_at": session.created_at.isoformat(),
-                "updated_at": session.updated_at.isoformat(),
+                "created_at": session.created_at,
+                "updated_at": session.updated_at,
                 "is_active": session.is_active,
                 "last_run_id": session.last_run_id,
             }
             for session in sessions
-        ]
+        ])
 
     @app.get(
         "/sessions/{session_id}",
-        dependencies=[Depends(require_authorization)],
+        dependencies=auth,
     )
     async def get_session(
         session_id: str,
-        session_manager: SessionManager = Depends(get_session_manager),
-        database: SessionDatabase = Depends(get_database),
-    ) -> Dict[str, Any]:
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> Response:
         """Get detailed information about an ACP session."""
+        session_manager: SessionManager = state.session_manager
+        database: SessionDatabase = state.database
         session = await session_manager.get_acp_session(session_id)
         if not session:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
 
-        # Get session history
-        history = await database.get_session_history(session_id)
+        # Get session history (optionally one page after the given history ID)
+        history = await database.get_session_history(
+            session_id, limit, include_payload=False, after_id=after_id
+        )
+        # A full page may have more after it; continue from its last entry
+        next_after_id = history[-1].id if limit and len(history) == limit else None
+        message_count = await database.count_session_history(session_id)
 
-        return {
+        return _json_response({
             "session_id": session.acp_session_id,
             "agent_name": session.agent_name,
             "zed_session_id": session.zed_session_id,
             "working_directory": session.working_directory,
-            "created_at": session.created_at.isoformat(),
-            "updated_at": session.updated_at.isoformat(),
+            "created_at": session.created_at,
+            "updated_at": session.updated_at,
             "is_active": session.is_active,
             "last_run_id": session.last_run_id,
-            "message_count": len(history),
+            "message_count": message_count,
+            "next_after_id": next_after_id,
             "history": [
                 {
+                    "id": msg.id,
                     "run_id": msg.run_id,
                     "role": msg.message_role,
-                    "created_at": msg.created_at.isoformat(),
+                    "created_at": msg.created_at,
                     "sequence_number": msg.sequence_number,
                 }
                 for msg in history
             ]
-        }
+        })
 
     @app.delete(
         "/sessions/{session_id}",
-        dependencies=[Depends(require_authorization)],
+        dependencies=auth,
     )
     async def delete_session(
         session_id: str,
-        session_manager: SessionManager = Depends(get_session_manager),
-    ) -> Dict[str, str]:
+    ) -> Response:
         """Delete an ACP session and its associated data."""
+        session_manager: SessionManager = state.session_manager
         deleted = await session_manager.delete_acp_session(session_id)
+        state.connection_pool.release_session(session_id)
         if not deleted:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
 
-        return {"deleted": session_id}
+        return _json_response({"deleted": session_id})
 
     return app
@@ -4,7 +4,7 @@ from datetime import datetime
 from enum import Enum
 from typing import List, Literal, Optional, Sequence
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class RunMode(str, Enum):
@@ -28,6 +28,9 @@ class RunStatus(str, Enum):
 class MessagePart(BaseModel):
     """Minimal IBMACP message part representation."""
 
+    # Parts are never modified once built; run output is assembled from text
+    model_config = ConfigDict(frozen=True)
+
     type: Literal["text"] = "text"
     text: str
 
@@ -35,6 +38,8 @@ class MessagePart(BaseModel):
 class Message(BaseModel):
     """Minimal IBMACP message format."""
 
+    model_config = ConfigDict(frozen=True)
+
     role: Literal["user", "assistant", "system"]
     content: List[MessagePart]
 
@@ -44,6 +49,12 @@ class Message(BaseModel):
             raise ValueError("Message content may not be empty")
         return value
 
+    def prompt_blocks(self) -> List[dict]:
+        """Return the content as ZedACP prompt content blocks."""
+        # MessagePart already has the ZedACP text block shape, so pydantic-core
+        # can dump the whole list in one call.
+        return self.model_dump(include={"content"})["content"]
+
 
 class RunCreateRequest(BaseModel):
     """Request payload for POST /runs."""
@@ -79,6 +90,9 @@ class Run(BaseModel):
 class AgentConfig(BaseModel):
     """Configuration entry loaded from agents.json."""
 
+    # Validated once at load time and shared read-only afterwards
+    model_config = ConfigDict(frozen=True)
+
     name: str
     command: List[str]
     description: Optional[str] = None
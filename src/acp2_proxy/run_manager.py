@@ -2,10 +2,12 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import sys
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Dict, Optional, TYPE_CHECKING
+from typing import Any, Dict, Optional, TYPE_CHECKING
 
 from .models import ErrorDetail, Message, MessagePart, Run, RunMode, RunStatus
 
@@ -14,31 +16,59 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# Slotted dataclasses drop the per-instance __dict__; slots= needs Python 3.10+.
+_DATACLASS_SLOTS: Dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+
+@dataclass(**_DATACLASS_SLOTS)
 class RunState:
     """Internal bookkeeping for an active run."""
 
     run: Run
     connection: Optional["ZedAgentConnection"] = None
     session_id: Optional[str] = None
-    buffered_parts: list[MessagePart] = field(default_factory=list)
+    session_event: asyncio.Event = field(default_factory=asyncio.Event)
+    # Raw text chunks; MessageParts are only built once the run completes
+    buffered_parts: list[str] = field(default_factory=list)
     cancel_event: asyncio.Event = field(default_factory=asyncio.Event)
     cancel_requested_at: Optional[datetime] = None
+    # Serializes state transitions of this run only
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
 
 
 class RunManager:
-    """Manage the lifecycle of active runs for cancellation and queries."""
+    """Manage the lifecycle of active runs for cancellation and queries.
+
+    Lookups read ``_runs`` directly: single dict operations cannot interleave
+    with other coroutines, so they need no lock. Mutations of a run take that
+    run's own lock, which keeps unrelated runs from queueing behind each other.
 
-    def __init__(self) -> None:
+    Once a run completes, fails or is cancelled its bookkeeping is dropped and
+    only the final ``Run`` is kept, in an LRU of the last ``max_terminal_runs``
+    finished runs, so a long-lived proxy does not accumulate state.
+    """
+
+    def __init__(self, max_terminal_runs: int = 1024) -> None:
         self._runs: Dict[str, RunState] = {}
-        self._lock = asyncio.Lock()
+        self._terminal_runs: "OrderedDict[str, Run]" = OrderedDict()
+        self._max_terminal_runs = max_terminal_runs
+
+    def _retire(self, run_id: str) -> None:
+        """Move a finished run from the active table to the terminal LRU."""
+        state = self._runs.pop(run_id, None)
+        if state is None:
+            return
+        self._terminal_runs[run_id] = state.run
+        if len(self._terminal_runs) > self._max_terminal_runs:
+            self._terminal_runs.popitem(last=False)
 
     async def create_run(self, agent: str, mode: RunMode) -> Run:
         """Initialize a run entry with queued status."""
         run_id = str(uuid.uuid4())
         timestamp = datetime.now(tz=timezone.utc)
-        run = Run(
+        # Run models are built from values produced here, so they skip
+        # validation; client input is validated at the API boundary
+        run = Run.model_construct(
             id=run_id,
             agent=agent,
             mode=mode,
@@ -46,126 +76,140 @@ class RunManager:
             created_at=timestamp,
             updated_at=timestamp,
         )
-        async with self._lock:
-            self._runs[run_id] = RunState(run=run)
-        logger.debug("Created run", extra={"run_id": run_id, "agent": agent, "mode": mode})
+        self._runs[run_id] = RunState(run=run)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Created run", extra={"run_id": run_id, "agent": agent, "mode": mode})
         return run
 
     async def start_run(self, run_id: str, connection: "ZedAgentConnection") -> None:
         """Mark run as in progress and associate connection."""
-        async with self._lock:
-            state = self._runs[run_id]
+        state = self._runs[run_id]
+        async with state.lock:
             state.run.status = RunStatus.in_progress
             state.run.updated_at = datetime.now(tz=timezone.utc)
             state.connection = connection
 
     async def set_session_id(self, run_id: str, session_id: str) -> None:
-        async with self._lock:
-            self._runs[run_id].session_id = session_id
+        state = self._runs[run_id]
+        state.session_id = session_id
+        state.session_event.set()
 
     async def append_output_part(self, run_id: str, text: str) -> None:
-        async with self._lock:
-            state = self._runs[run_id]
-            part = MessagePart(text=text)
-            state.buffered_parts.append(part)
-            logger.debug("Appended output part", extra={
-                "run_id": run_id,
-                "text_length": len(text),
-                "text_preview": text[:50] + "..." if len(text) > 50 else text,
-                "total_parts": len(state.buffered_parts)
-            })
+        state = self._runs[run_id]
+        async with state.lock:
+            state.buffered_parts.append(text)
+            # Called once per streamed chunk; skip building the record unless DEBUG is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Appended output part", extra={
+                    "run_id": run_id,
+                    "text_length": len(text),
+                    "text_preview": text[:50] + "..." if len(text) > 50 else text,
+                    "total_parts": len(state.buffered_parts)
+                })
 
     async def complete_run(self, run_id: str, stop_reason: str | None = None) -> Run:
-        async with self._lock:
-            state = self._runs[run_id]
+        state = self._runs[run_id]
+        async with state.lock:
             state.run.status = RunStatus.completed
             state.run.stop_reason = stop_reason
             state.run.updated_at = datetime.now(tz=timezone.utc)
             if state.buffered_parts:
-                state.run.output = Message(role="assistant", content=list(state.buffered_parts))
-                logger.debug("Completed run with output", extra={
-                    "run_id": run_id,
-                    "parts_count": len(state.buffered_parts),
-                    "total_text_length": sum(len(part.text) for part in state.buffered_parts),
-                    "output_content_preview": state.run.output.content[0].text[:100] + "..." if state.run.output.content else "No content"
-                })
+                # Text deltas are additive, so the output is one part holding
+                # their concatenation
+                text = "".join(state.buffered_parts)
+                content = [MessagePart.model_construct(type="text", text=text)]
+                state.run.output = Message.model_construct(role="assistant", content=content)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Completed run with output", extra={
+                        "run_id": run_id,
+                        "parts_count": len(state.buffered_parts),
+                        "total_text_length": len(text),
+                        "output_content_preview": state.run.output.content[0].text[:100] + "..." if state.run.output.content else "No content"
+                    })
             else:
                 logger.warning("Completed run with no buffered parts", extra={
                     "run_id": run_id,
                     "stop_reason": stop_reason
                 })
             state.connection = None
+            self._retire(run_id)
             return state.run
 
     async def fail_run(self, run_id: str, error: str, code: str = "agent_error") -> Run:
-        async with self._lock:
-            state = self._runs[run_id]
+        state = self._runs[run_id]
+        async with state.lock:
             state.run.status = RunStatus.failed
             state.run.updated_at = datetime.now(tz=timezone.utc)
-            state.run.error = ErrorDetail(code=code, message=error)
+            state.run.error = ErrorDetail.model_construct(code=code, message=error)
             state.connection = None
+            self._retire(run_id)
             return state.run
 
-    async def cancel_run(self, run_id: str) -> Run:
-        async with self._lock:
-            state = self._runs.get(run_id)
-            if not state:
-                raise KeyError(run_id)
+    async def cancel_run(self, run_id: str) -> Optional[Run]:
+        state = self._runs.get(run_id)
+        if not state:
+            # A run that already finished keeps its final state; ``None`` once evicted
+            return self._terminal_runs.get(run_id)
+        async with state.lock:
             state.run.status = RunStatus.cancelled
             state.run.updated_at = datetime.now(tz=timezone.utc)
             state.connection = None
+            self._retire(run_id)
             return state.run
 
     async def request_cancel(self, run_id: str, *, timeout: float | None = None) -> Run:
-        async with self._lock:
-            state = self._runs[run_id]
+        state = self._runs.get(run_id)
+        if not state:
+            # Finished runs have nothing left to cancel
+            return self._terminal_runs[run_id].model_copy()
+        async with state.lock:
+            now = datetime.now(tz=timezone.utc)
             if state.run.status != RunStatus.cancelling:
                 state.run.status = RunStatus.cancelling
-                state.run.updated_at = datetime.now(tz=timezone.utc)
-            state.cancel_requested_at = datetime.now(tz=timezone.utc)
+                state.run.updated_at = now
+            state.cancel_requested_at = now
             state.cancel_event.set()
+            run = state.run
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug("Cancellation requested", extra={"run_id": run_id})
-            return state.run.model_copy(deep=True)
+        # Snapshot the "cancelling" state for the response. Transitions assign
+        # new field values rather than mutating them, so a shallow copy suffices.
+        return run.model_copy()
 
     async def get_run(self, run_id: str) -> Run:
-        async with self._lock:
-            state = self._runs[run_id]
+        state = self._runs.get(run_id)
+        if state is not None:
             return state.run
+        return self._terminal_runs[run_id]
 
     async def pop(self, run_id: str) -> None:
-        async with self._lock:
-            removed = self._runs.pop(run_id, None)
-        logger.debug("Run removed", extra={"run_id": run_id})
+        self._runs.pop(run_id, None)
+        self._terminal_runs.pop(run_id, None)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Run removed", extra={"run_id": run_id})
 
     async def connection_for(self, run_id: str) -> Optional["ZedAgentConnection"]:
-        async with self._lock:
-            state = self._runs.get(run_id)
-            if not state:
-                return None
-            return state.connection
+        state = self._runs.get(run_id)
+        return state.connection if state else None
 
     async def session_for(self, run_id: str) -> Optional[str]:
-        async with self._lock:
-            state = self._runs.get(run_id)
-            if not state:
-                return None
-            return state.session_id
+        state = self._runs.get(run_id)
+        return state.session_id if state else None
 
     async def wait_for_session(self, run_id: str, timeout: float = 5.0) -> Optional[str]:
         """Wait for the session identifier to become available."""
-        deadline = asyncio.get_event_loop().time() + timeout
-        while True:
-            session_id = await self.session_for(run_id)
-            if session_id is not None:
-                return session_id
-            if asyncio.get_event_loop().time() >= deadline:
-                return None
-            await asyncio.sleep(0.05)
+        state = self._runs.get(run_id)
+        if not state:
+            return None
+        try:
+            await asyncio.wait_for(state.session_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return state.session_id
 
     async def cancel_event_for(self, run_id: str) -> asyncio.Event:
-        async with self._lock:
-            state = self._runs.get(run_id)
-            if not state:
-                raise KeyError(run_id)
-            return state.cancel_event
+        state = self._runs.get(run_id)
+        if not state:
+            raise KeyError(run_id)
+        return state.cancel_event
 
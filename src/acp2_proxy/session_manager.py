@@ -9,13 +9,14 @@ import asyncio
 import json
 import logging
 import os
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Dict, Optional, List, TYPE_CHECKING
+from typing import AsyncIterator, Dict, Mapping, Optional, List, Tuple, TYPE_CHECKING
 from pathlib import Path
+from types import MappingProxyType
 
-from .database import SessionDatabase, ACPSession, SessionHistory
-from .models import Message
+from .database import _DATACLASS_SLOTS, SessionDatabase, ACPSession, SessionHistory
+from .models import AgentConfig, Message
 
 if TYPE_CHECKING:
     from .zed_agent import ZedAgentConnection
@@ -23,7 +24,7 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class ActiveSession:
     """Active ACP session with ZedACP connection."""
     acp_session: ACPSession
@@ -39,12 +40,15 @@ class SessionManager:
     and cleanup of ACP sessions that map to ZedACP sessions.
     """
 
-    def __init__(self, database: SessionDatabase, agent_config: dict):
+    def __init__(self, database: SessionDatabase, agent_config: Mapping[str, AgentConfig]):
         """Initialize session manager."""
         self.db = database
-        self.agent_config = agent_config
+        # Read-only view: the configs are validated once at load and never change
+        self.agent_config: Mapping[str, AgentConfig] = MappingProxyType(dict(agent_config))
         self.active_sessions: Dict[str, ActiveSession] = {}
-        self._lock = asyncio.Lock()
+        # Per-ID creation locks with their user counts, so one ID is never
+        # created twice while unrelated sessions are created concurrently
+        self._creation_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
 
     async def get_or_create_session(
         self,
@@ -58,34 +62,24 @@ class SessionManager:
         For existing sessions, loads the ZedACP session using session/load.
         For new sessions, creates a new ZedACP session and maps it.
         """
-        async with self._lock:
-            # Check if session already exists
+        # Existing sessions need no lock; the lookup is usually a cache hit
+        existing_session = await self.db.get_acp_session(acp_session_id)
+        if existing_session:
+            return await self._reopen_session(existing_session)
+
+        async with self._creation_lock(acp_session_id):
+            # Another request may have created the session while we waited
             existing_session = await self.db.get_acp_session(acp_session_id)
             if existing_session:
-                logger.debug("Found existing ACP session", extra={
-                    "acp_session_id": acp_session_id,
-                    "zed_session_id": existing_session.zed_session_id,
-                    "agent": existing_session.agent_name
-                })
-
-                # Update last activity
-                existing_session.updated_at = datetime.utcnow()
-                await self.db.create_acp_session(
-                    acp_session_id=existing_session.acp_session_id,
-                    agent=existing_session.agent_name,
-                    cwd=existing_session.working_directory,
-                    zed_session_id=existing_session.zed_session_id,
-                    metadata=existing_session.metadata
-                )
-
-                return ActiveSession(acp_session=existing_session)
+                return await self._reopen_session(existing_session)
 
             # Create new session
-            logger.debug("Creating new ACP session", extra={
-                "acp_session_id": acp_session_id,
-                "agent": agent,
-                "cwd": cwd
-            })
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Creating new ACP session", extra={
+                    "acp_session_id": acp_session_id,
+                    "agent": agent,
+                    "cwd": cwd
+                })
 
             # Generate initial ZedACP session ID (will be updated when connection is made)
             zed_session_id = f"zed_{acp_session_id}"
@@ -102,6 +96,37 @@ class SessionManager:
 
             return active_session
 
+    @asynccontextmanager
+    async def _creation_lock(self, acp_session_id: str) -> AsyncIterator[None]:
+        """Hold the creation lock for one session ID, dropping it after its last user."""
+        lock, users = self._creation_locks.get(acp_session_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._creation_locks[acp_session_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._creation_locks[acp_session_id]
+            if users == 1:
+                del self._creation_locks[acp_session_id]
+            else:
+                self._creation_locks[acp_session_id] = (lock, users - 1)
+
+    async def _reopen_session(self, existing_session: ACPSession) -> ActiveSession:
+        """Mark an existing session as active again."""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Found existing ACP session", extra={
+                "acp_session_id": existing_session.acp_session_id,
+                "zed_session_id": existing_session.zed_session_id,
+                "agent": existing_session.agent_name
+            })
+
+        # Update last activity
+        await self.db.touch_acp_session(existing_session.acp_session_id)
+
+        return ActiveSession(acp_session=existing_session)
+
     async def create_ephemeral_session(self, agent: str) -> ActiveSession:
         """Create a temporary session for stateless runs."""
         import uuid
@@ -117,13 +142,14 @@ class SessionManager:
         zed_session_id: str
     ) -> None:
         """Link ACP session with ZedACP session connection."""
-        async with self._lock:
-            if acp_session_id in self.active_sessions:
-                self.active_sessions[acp_session_id].zed_connection = zed_connection
+        active_session = self.active_sessions.get(acp_session_id)
+        if active_session is not None:
+            active_session.zed_connection = zed_connection
 
-                # Update database with actual ZedACP session ID
-                await self.db.update_zed_session_id(acp_session_id, zed_session_id)
+            # Update database with actual ZedACP session ID
+            await self.db.update_zed_session_id(acp_session_id, zed_session_id)
 
+            if logger.isEnabledFor(logging.DEBUG):
                 logger.debug("Linked ZedACP session", extra={
                     "acp_session_id": acp_session_id,
                     "zed_session_id": zed_session_id
@@ -163,42 +189,44 @@ class SessionManager:
             run_id=run_id,
             message=message,
             sequence_number=sequence_number,
-            zed_message=zed_message
+            zed_message=zed_message,
+            # Bump the session's last activity in the same transaction
+            touch_session=True
         )
 
-        # Update session's last activity
-        session = await self.db.get_acp_session(acp_session_id)
-        if session:
-            session.updated_at = datetime.utcnow()
-            await self.db.create_acp_session(
-                acp_session_id=session.acp_session_id,
-                agent=session.agent_name,
-                cwd=session.working_directory,
-                zed_session_id=session.zed_session_id,
-                metadata=session.metadata
-            )
+    async def finalize_run(
+        self,
+        acp_session_id: str,
+        run_id: str,
+        user_message: Message,
+        assistant_message: Optional[Message] = None
+    ) -> None:
+        """Store a completed run's exchange and update session activity in one transaction."""
+        messages = [user_message] if assistant_message is None else [user_message, assistant_message]
+        await self.db.record_run(acp_session_id, run_id, messages)
 
     async def get_session_history(
         self,
         acp_session_id: str,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        include_payload: bool = True,
+        after_id: Optional[int] = None
     ) -> List[SessionHistory]:
         """Get message history for a session."""
-        return await self.db.get_session_history(acp_session_id, limit)
+        return await self.db.get_session_history(acp_session_id, limit, include_payload, after_id)
 
     async def delete_acp_session(self, acp_session_id: str) -> bool:
         """Delete ACP session and cleanup resources."""
-        async with self._lock:
-            # Remove from active sessions if present
-            self.active_sessions.pop(acp_session_id, None)
+        # Remove from active sessions if present
+        self.active_sessions.pop(acp_session_id, None)
 
-            # Delete from database
-            deleted = await self.db.delete_acp_session(acp_session_id)
+        # Delete from database
+        deleted = await self.db.delete_acp_session(acp_session_id)
 
-            if deleted:
-                logger.debug("Deleted ACP session", extra={"acp_session_id": acp_session_id})
+        if deleted:
+            logger.debug("Deleted ACP session", extra={"acp_session_id": acp_session_id})
 
-            return deleted
+        return deleted
 
     async def cleanup_old_sessions(self, days_old: int = 30) -> int:
         """Clean up old inactive sessions."""
@@ -208,23 +236,17 @@ class SessionManager:
 
     async def update_session_activity(self, acp_session_id: str, run_id: str) -> None:
         """Update session's last activity timestamp and run ID."""
-        with self.db._get_connection() as conn:
-            conn.execute("""
-                UPDATE acp_sessions
-                SET updated_at = ?, last_run_id = ?
-                WHERE acp_session_id = ?
-            """, (datetime.utcnow().isoformat(), run_id, acp_session_id))
-            conn.commit()
-
-    def get_agent_config(self, agent_name: str) -> Dict:
+        await self.db.update_session_activity(acp_session_id, run_id)
+
+    def get_agent_config(self, agent_name: str) -> Optional[AgentConfig]:
         """Get agent configuration from loaded config."""
-        return self.agent_config.get(agent_name, {})
+        return self.agent_config.get(agent_name)
 
     async def health_check(self) -> Dict:
         """Perform health check on session manager."""
         try:
             # Test database connectivity
-            sessions = await self.list_acp_sessions(active_only=False, agent_name=None)
+            sessions = await self.db.list_acp_session_ids(active_only=False)
             session_count = len(sessions)
 
             # Count active sessions
@@ -234,7 +256,8 @@ class SessionManager:
                 "status": "healthy",
                 "total_sessions": session_count,
                 "active_sessions": active_count,
-                "database_path": self.db.db_path
+                "database_path": self.db.db_path,
+                "session_cache": self.db.session_cache_stats()
             }
         except Exception as e:
             logger.error("Session manager health check failed", extra={"error": str(e)})
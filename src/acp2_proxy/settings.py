@@ -13,6 +13,15 @@ class Settings:
 
     auth_token: Optional[str]
     agents_config_path: Path
+    db_path: str = "acp2_sessions.db"
+    db_read_pool_size: int = 8
+    history_batch_size: int = 500
+    history_flush_ms: int = 50
+    agent_pool_size: int = 1
+    default_cwd: str = "."
+    stream_coalesce_ms: int = 5
+    session_keepalive_s: int = 300
+    session_keepalive_max: int = 32
 
 
 @lru_cache()
@@ -20,4 +29,25 @@ def get_settings() -> Settings:
     """Return cached settings."""
     auth_token = os.getenv("ACP2_AUTH_TOKEN")
     config_path_raw = os.getenv("ACP2_AGENTS_CONFIG", "config/agents.json")
-    return Settings(auth_token=auth_token, agents_config_path=Path(config_path_raw))
+    db_path = os.getenv("ACP2_DB_PATH", "acp2_sessions.db")
+    db_read_pool_size = int(os.getenv("ACP2_DB_READ_POOL_SIZE", "8"))
+    history_batch_size = int(os.getenv("ACP2_HISTORY_BATCH_SIZE", "500"))
+    history_flush_ms = int(os.getenv("ACP2_HISTORY_FLUSH_MS", "50"))
+    agent_pool_size = int(os.getenv("ACP2_AGENT_POOL_SIZE", "1"))
+    default_cwd = os.getenv("ACP2_DEFAULT_CWD") or os.getcwd()
+    stream_coalesce_ms = int(os.getenv("ACP2_STREAM_COALESCE_MS", "5"))
+    session_keepalive_s = int(os.getenv("ACP2_SESSION_KEEPALIVE_S", "300"))
+    session_keepalive_max = int(os.getenv("ACP2_SESSION_KEEPALIVE_MAX", "32"))
+    return Settings(
+        auth_token=auth_token,
+        agents_config_path=Path(config_path_raw),
+        db_path=db_path,
+        db_read_pool_size=db_read_pool_size,
+        history_batch_size=history_batch_size,
+        history_flush_ms=history_flush_ms,
+        agent_pool_size=agent_pool_size,
+        default_cwd=default_cwd,
+        stream_coalesce_ms=stream_coalesce_ms,
+        session_keepalive_s=session_keepalive_s,
+        session_keepalive_max=session_keepalive_max,
+    )
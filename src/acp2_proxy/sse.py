@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Dict
+
+from starlette.responses import StreamingResponse
+from starlette.types import Send
+
+
+def format_sse_into(buf: bytearray, prefix: bytes, payload: bytes, suffix: bytes = b"\n\n") -> None:
+    """Append one SSE frame to ``buf`` without building an intermediate bytes object.
+
+    ``prefix`` is the pre-encoded ``event: <name>\\ndata: `` header.
+    """
+    buf += prefix
+    buf += payload
+    buf += suffix
+
+
+class SSEBuffer:
+    """Bounded double buffer of encoded SSE frames between one producer and one consumer.
+
+    The producer appends frames to the active buffer; the consumer swaps the
+    buffers and yields everything accumulated since its last wakeup as a single
+    chunk. When the active buffer reaches ``high_water`` bytes the producer waits
+    until the consumer has taken it, which caps memory for slow clients.
+    """
+
+    def __init__(self, high_water: int = 64 * 1024) -> None:
+        self._active = bytearray()
+        self._spare = bytearray()
+        self._high_water = high_water
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._closed = False
+
+    async def write(self, frame: bytes) -> None:
+        """Append an encoded frame, waiting for the consumer if the buffer is full.
+
+        Frames written after :meth:`close` are dropped, since nothing consumes them.
+        """
+        if self._closed:
+            return
+        self._active += frame
+        await self._written()
+
+    async def write_frame(self, prefix: bytes, payload: bytes, suffix: bytes = b"\n\n") -> None:
+        """Like :meth:`write`, but assemble the frame in place from its parts."""
+        if self._closed:
+            return
+        format_sse_into(self._active, prefix, payload, suffix)
+        await self._written()
+
+    async def _written(self) -> None:
+        self._ready.set()
+        if len(self._active) >= self._high_water:
+            self._drained.clear()
+            await self._drained.wait()
+
+    def close(self) -> None:
+        """Mark the stream finished; the consumer stops once the buffer is empty."""
+        self._closed = True
+        self._ready.set()
+        # Release a producer blocked on backpressure.
+        self._drained.set()
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._chunks()
+
+    async def _chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            if not self._active:
+                if self._closed:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            full, self._active = self._active, self._spare
+            self._spare = full
+            self._drained.set()
+            chunk = bytes(full)
+            full.clear()
+            yield chunk
+
+
+class SSEResponse(StreamingResponse):
+    """Streaming response for ``text/event-stream`` bodies of pre-encoded bytes.
+
+    Reuses a single ``http.response.body`` message for every chunk instead of
+    building a new dict per send. This relies on the ASGI server and the
+    middleware stack consuming each message before ``send`` returns, which
+    holds for uvicorn and Starlette's bundled middleware.
+    """
+
+    media_type = "text/event-stream"
+
+    async def stream_response(self, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        message: Dict[str, Any] = {"type": "http.response.body", "body": b"", "more_body": True}
+        async for chunk in self.body_iterator:
+            message["body"] = chunk
+            await send(message)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
+import os
+from collections import deque
 from asyncio import StreamReader, StreamWriter
-from typing import Any, Awaitable, Callable, Coroutine, Optional, Sequence
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional, Sequence
+
+import orjson
 
 
 logger = logging.getLogger(__name__)
@@ -18,7 +21,94 @@ class PromptCancelled(AgentProcessError):
     """Raised when the agent acknowledges cancellation."""
 
 
-NotificationHandler = Callable[[dict], Awaitable[None]]
+# Notifications a streaming request may fall behind by before the reader
+# waits for it, so a slow consumer still pushes back on the agent
+_STREAM_BACKLOG = 256
+
+# Pre-encoded session/cancel notifications
+_CANCEL_FRAME = b'{"jsonrpc":"2.0","method":"session/cancel"}\n'
+_CANCEL_SESSION_PREFIX = b'{"jsonrpc":"2.0","method":"session/cancel","params":{"sessionId":'
+
+# Encoded '{"jsonrpc":"2.0","method":...,"id":' prefixes, one per method used
+_REQUEST_PREFIXES: dict[str, bytes] = {}
+
+
+def _encode_request(request_id: int, method: str, params: Optional[dict[str, Any]]) -> bytes:
+    """Encode a request frame without building its envelope dict."""
+    prefix = _REQUEST_PREFIXES.get(method)
+    if prefix is None:
+        prefix = _REQUEST_PREFIXES[method] = b'{"jsonrpc":"2.0","method":' + orjson.dumps(method) + b',"id":'
+    if params is None:
+        return b"%s%d}\n" % (prefix, request_id)
+    return b'%s%d,"params":%s}\n' % (prefix, request_id, orjson.dumps(params))
+
+
+# Stderr lines retained per connection, the read size used to collect
+# them, and the length at which an unterminated line is cut
+_STDERR_LINES = 1024
+_STDERR_CHUNK = 4096
+_STDERR_MAX_LINE = 65536
+
+# Buffered stdin bytes above which writers wait for the agent to catch up
+_DRAIN_THRESHOLD = 16384
+
+
+async def _drain(task: asyncio.Task[Any]) -> None:
+    """Cancel a task and wait for it, discarding its outcome."""
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, AgentProcessError):
+        pass
+
+
+class _LineFramer:
+    """Split agent stdout into LF-terminated lines.
+
+    Reads fixed-size chunks and joins them once per line, instead of growing
+    a buffer the way ``StreamReader.readline`` does. Lines are not subject to
+    the stream's 64 KiB line limit.
+    """
+
+    __slots__ = ("_chunks",)
+
+    _READ_SIZE = 65536
+
+    def __init__(self) -> None:
+        # Only the head can contain a newline: it is what was left of the
+        # chunk the previous line was cut from
+        self._chunks: deque[bytes] = deque()
+
+    async def readline(self, stream: StreamReader) -> bytes:
+        """Return the next line including its newline, or ``b""`` at EOF."""
+        chunks = self._chunks
+        if chunks:
+            head = chunks[0]
+            end = head.find(b"\n") + 1
+            if end:
+                if end == len(head):
+                    chunks.popleft()
+                else:
+                    chunks[0] = head[end:]
+                return head[:end]
+
+        while True:
+            chunk = await stream.read(self._READ_SIZE)
+            if not chunk:
+                # EOF: hand back an unterminated tail first, like readline()
+                line = b"".join(chunks)
+                chunks.clear()
+                return line
+            end = chunk.find(b"\n") + 1
+            if not end:
+                chunks.append(chunk)
+                continue
+            chunks.append(chunk[:end])
+            line = b"".join(chunks)
+            chunks.clear()
+            if end < len(chunk):
+                chunks.append(chunk[end:])
+            return line
 
 
 class ZedAgentConnection:
@@ -29,15 +119,30 @@ class ZedAgentConnection:
             raise ValueError("Agent command cannot be empty")
         self._command = list(command)
         self._api_key = api_key
+        # Built once; None lets the child inherit our environment unchanged
+        self._env: Optional[dict[str, str]] = {**os.environ, "OPENAI_API_KEY": api_key} if api_key else None
         self._logger = log or logger.getChild("ZedAgentConnection")
         self._process: Optional[asyncio.subprocess.Process] = None
         self._stdout: Optional[StreamReader] = None
+        self._framer = _LineFramer()
         self._stdin: Optional[StreamWriter] = None
-        self._stderr_buffer: list[str] = []
+        # Only the most recent stderr lines are kept for error messages
+        self._stderr_buffer: deque[str] = deque(maxlen=_STDERR_LINES)
         self._id_counter = 0
-        self._read_lock = asyncio.Lock()
         self._write_lock = asyncio.Lock()
         self._stderr_task: Optional[asyncio.Task[None]] = None
+        # A single reader task owns stdout and routes responses to the
+        # request waiting on that id, and notifications to the stream
+        # subscribed to their session
+        self._reader_task: Optional[asyncio.Task[None]] = None
+        self._reader_error: Optional[AgentProcessError] = None
+        self._pending: dict[int, asyncio.Future[dict[str, Any]] | asyncio.Queue[Any]] = {}
+        self._subscriptions: dict[Any, asyncio.Queue[Any]] = {}
+
+    @property
+    def running(self) -> bool:
+        """Whether the agent subprocess has been started and has not exited."""
+        return self._process is not None and self._process.returncode is None
 
     async def __aenter__(self) -> "ZedAgentConnection":
         await self.start()
@@ -52,12 +157,7 @@ class ZedAgentConnection:
             return
         self._logger.debug("Starting agent process", extra={"command": self._command})
 
-        # Set up environment variables
-        env = None
         if self._api_key:
-            import os
-            env = os.environ.copy()
-            env["OPENAI_API_KEY"] = self._api_key
             self._logger.debug("Setting OPENAI_API_KEY environment variable", extra={"key_length": len(self._api_key)})
         else:
             self._logger.debug("No API key provided for agent authentication")
@@ -67,29 +167,47 @@ class ZedAgentConnection:
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
-            env=env,
+            env=self._env,
         )
         self._process = process
         assert process.stdin and process.stdout
         self._stdin = process.stdin
         self._stdout = process.stdout
+        self._framer = _LineFramer()
+        self._reader_error = None
         if process.stderr:
             self._stderr_task = asyncio.create_task(self._collect_stderr(process.stderr))
+        self._reader_task = asyncio.create_task(self._reader_loop())
 
     async def _collect_stderr(self, stream: StreamReader) -> None:
+        # Read in chunks and split lines here rather than paying a readline()
+        # buffer per line; ``tail`` holds the unterminated remainder
+        tail = b""
         try:
             while True:
-                data = await stream.readline()
-                if not data:
+                chunk = await stream.read(_STDERR_CHUNK)
+                if not chunk:
                     break
-                decoded_line = data.decode().rstrip()
-                self._stderr_buffer.append(decoded_line)
-                # Log stderr output for debugging (but avoid flooding logs)
-                if decoded_line.strip():
-                    self._logger.debug("Agent stderr output", extra={"stderr_line": decoded_line})
+                lines = (tail + chunk).split(b"\n")
+                tail = lines.pop()
+                if len(tail) > _STDERR_MAX_LINE:
+                    lines.append(tail)
+                    tail = b""
+                self._append_stderr(lines)
+            if tail:
+                self._append_stderr([tail])
         except Exception:  # pragma: no cover - best effort logging
             self._logger.exception("Error collecting agent stderr")
 
+    def _append_stderr(self, lines: list[bytes]) -> None:
+        debug = self._logger.isEnabledFor(logging.DEBUG)
+        for raw in lines:
+            decoded_line = raw.rstrip().decode(errors="replace")
+            self._stderr_buffer.append(decoded_line)
+            # Log stderr output for debugging (but avoid flooding logs)
+            if debug and decoded_line.strip():
+                self._logger.debug("Agent stderr output", extra={"stderr_line": decoded_line})
+
     async def close(self) -> None:
         """Terminate the subprocess and cleanup resources."""
         if not self._process:
@@ -102,10 +220,11 @@ class ZedAgentConnection:
                 pass
             self._stdin.close()
             self._logger.debug("stdin closed")
+        if self._reader_task:
+            await _drain(self._reader_task)
         if self._stderr_task:
             self._logger.debug("cancelling stderr task")
-            self._stderr_task.cancel()
-            await asyncio.gather(self._stderr_task, return_exceptions=True)
+            await _drain(self._stderr_task)
             self._logger.debug("stderr task cancelled")
         try:
             await asyncio.wait_for(self._process.wait(), timeout=1)
@@ -125,19 +244,31 @@ class ZedAgentConnection:
         self._stdin = None
         self._stdout = None
         self._stderr_task = None
+        self._reader_task = None
 
     async def _write_json(self, payload: dict[str, Any]) -> None:
-        if not self._stdin:
+        # orjson produces bytes directly, so there is no str to encode
+        await self._write_frame(orjson.dumps(payload) + b"\n")
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug("Sent JSON-RPC message to agent", extra={
+                "method": payload.get("method"),
+                "id": payload.get("id"),
+                "params": payload.get("params")
+            })
+
+    async def _write_frame(self, frame: bytes) -> None:
+        """Write one encoded, newline-terminated frame to the agent."""
+        stdin = self._stdin
+        if not stdin:
             raise AgentProcessError("Agent stdin unavailable")
-        data = json.dumps(payload)
-        async with self._write_lock:
-            self._stdin.write(data.encode() + b"\n")
-            await self._stdin.drain()
-        self._logger.debug("Sent JSON-RPC message to agent", extra={
-            "method": payload.get("method"),
-            "id": payload.get("id"),
-            "params": payload.get("params")
-        })
+        # write() hands the frame to the pipe straight away; a single call
+        # cannot interleave with other frames. Only yield to drain() when the
+        # agent has fallen behind, or to surface a broken pipe.
+        stdin.write(frame)
+        transport = stdin.transport
+        if transport.get_write_buffer_size() > _DRAIN_THRESHOLD or transport.is_closing():
+            async with self._write_lock:
+                await stdin.drain()
 
     async def _read_json(self) -> dict[str, Any]:
         if not self._stdout:
@@ -145,8 +276,7 @@ class ZedAgentConnection:
 
         # Read lines until we find valid JSON
         while True:
-            async with self._read_lock:
-                raw = await self._stdout.readline()
+            raw = await self._framer.readline(self._stdout)
             if not raw:
                 stderr = self.stderr()
                 message = "Agent process closed stdout unexpectedly"
@@ -156,34 +286,98 @@ class ZedAgentConnection:
                     message = f"{message}. No stderr output available."
                 raise AgentProcessError(message)
 
-            decoded = raw.decode().strip()
-            # self._logger.debug("Raw agent output", extra={"raw_output": repr(decoded), "length": len(decoded)})
-
-            if not decoded:
+            # Work on the raw bytes: orjson parses them directly, so a line
+            # is never decoded to str
+            raw = raw.strip()
+            if not raw:
                 continue  # Skip empty lines
 
             # Skip log lines (they contain ANSI color codes and don't start with '{')
-            if not decoded.startswith('{'):
-                # self._logger.debug("Skipping non-JSON line", extra={"line": repr(decoded)})
+            if raw[:1] != b"{":
                 continue
 
             try:
-                payload = json.loads(decoded)
-                self._logger.debug("Received JSON-RPC message from agent", extra={
-                    "method": payload.get("method"),
-                    "id": payload.get("id"),
-                    "has_result": "result" in payload,
-                    "has_error": "error" in payload,
-                    "result": payload.get("result"),
-                    "error": payload.get("error")
-                })
-                self._logger.debug("Parsed JSON payload", extra={"payload": payload})
+                payload = orjson.loads(raw)
+                if self._logger.isEnabledFor(logging.DEBUG):
+                    self._logger.debug("Received JSON-RPC message from agent", extra={
+                        "method": payload.get("method"),
+                        "id": payload.get("id"),
+                        "has_result": "result" in payload,
+                        "has_error": "error" in payload,
+                        "result": payload.get("result"),
+                        "error": payload.get("error")
+                    })
+                    self._logger.debug("Parsed JSON payload", extra={"payload": payload})
                 return payload
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 # If it's not valid JSON, skip it and continue reading
-                self._logger.debug("Skipping invalid JSON", extra={"line": repr(decoded), "error": str(e)})
+                if self._logger.isEnabledFor(logging.DEBUG):
+                    self._logger.debug("Skipping invalid JSON", extra={"line": repr(raw), "error": str(e)})
                 continue
 
+    async def _reader_loop(self) -> None:
+        """Read agent output until EOF, dispatching each message."""
+        try:
+            while True:
+                payload = await self._read_json()
+                if "method" not in payload:
+                    # A response: wake the request waiting on its id. Late
+                    # responses to abandoned requests are dropped.
+                    waiter = self._pending.pop(payload.get("id"), None)
+                    if isinstance(waiter, asyncio.Queue):
+                        await waiter.put(payload)
+                    elif waiter is not None and not waiter.done():
+                        waiter.set_result(payload)
+                    continue
+                params = payload.get("params")
+                session_key = params.get("sessionId") if isinstance(params, dict) else None
+                if session_key is None:
+                    # Not addressed to a session (e.g. a bare session/cancelled):
+                    # every active stream sees it, as a lone reader would have
+                    for queue in list(self._subscriptions.values()):
+                        await queue.put(payload)
+                    continue
+                queue = self._subscriptions.get(session_key)
+                if queue is not None:
+                    await queue.put(payload)
+                elif self._logger.isEnabledFor(logging.DEBUG):
+                    self._logger.debug("Dropping notification for unsubscribed session", extra={
+                        "method": payload.get("method"),
+                        "session_id": session_key,
+                    })
+        except AgentProcessError as exc:
+            self._fail_pending(exc)
+        except asyncio.CancelledError:
+            self._fail_pending(AgentProcessError("Agent connection closed"))
+            raise
+        except Exception as exc:  # pragma: no cover - defensive
+            self._logger.exception("Agent reader failed")
+            self._fail_pending(AgentProcessError(f"Agent reader failed: {exc}"))
+
+    def _fail_pending(self, exc: AgentProcessError) -> None:
+        """Fail every waiting request; later requests fail immediately."""
+        self._reader_error = exc
+        pending = list(self._pending.values())
+        self._pending.clear()
+        for waiter in pending:
+            if isinstance(waiter, asyncio.Queue):
+                # The connection is gone, so a backlogged frame can make room
+                if waiter.full():
+                    waiter.get_nowait()
+                waiter.put_nowait(exc)
+            elif not waiter.done():
+                waiter.set_exception(exc)
+
+    async def _send_request(self, request_id: int, method: str, params: Optional[dict[str, Any]]) -> None:
+        """Write a request frame; only ``params`` goes through orjson."""
+        await self._write_frame(_encode_request(request_id, method, params))
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug("Sent JSON-RPC message to agent", extra={
+                "method": method,
+                "id": request_id,
+                "params": params
+            })
+
     def _next_id(self) -> int:
         self._id_counter += 1
         return self._id_counter
@@ -192,24 +386,57 @@ class ZedAgentConnection:
         self,
         method: str,
         params: Optional[dict[str, Any]] = None,
-        *,
-        handler: NotificationHandler | None = None,
     ) -> dict[str, Any] | None:
         """Send a JSON-RPC request and wait for its response."""
+        if self._reader_error is not None:
+            raise AgentProcessError(*self._reader_error.args)
         request_id = self._next_id()
-        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
-        if params is not None:
-            message["params"] = params
-        await self._write_json(message)
-
-        while True:
-            payload = await self._read_json()
-            if payload.get("id") == request_id:
-                if "error" in payload:
-                    raise AgentProcessError(payload["error"])
-                return payload.get("result")
-            if handler:
-                await handler(payload)
+        future: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send_request(request_id, method, params)
+            payload = await future
+        finally:
+            self._pending.pop(request_id, None)
+
+        if "error" in payload:
+            raise AgentProcessError(payload["error"])
+        return payload.get("result")
+
+    async def stream(self, method: str, params: dict[str, Any]) -> AsyncIterator[dict[str, Any]]:
+        """Send a request and yield the notifications for its session.
+
+        The response frame (the one without a ``method``) is yielded last;
+        an error response is raised as ``AgentProcessError`` instead. Close
+        the generator if you stop iterating early.
+        """
+        if self._reader_error is not None:
+            raise AgentProcessError(*self._reader_error.args)
+        request_id = self._next_id()
+        session_key = params.get("sessionId")
+        queue: asyncio.Queue[Any] = asyncio.Queue(_STREAM_BACKLOG)
+        self._pending[request_id] = queue
+        self._subscriptions[session_key] = queue
+        try:
+            await self._send_request(request_id, method, params)
+            while True:
+                frame = await queue.get()
+                if isinstance(frame, AgentProcessError):
+                    raise frame
+                if "method" in frame:
+                    yield frame
+                    continue
+                if "error" in frame:
+                    raise AgentProcessError(frame["error"])
+                yield frame
+                return
+        finally:
+            self._pending.pop(request_id, None)
+            if self._subscriptions.get(session_key) is queue:
+                del self._subscriptions[session_key]
+            # Let the reader go if it is waiting to hand us another frame
+            while not queue.empty():
+                queue.get_nowait()
 
     async def notify(self, method: str, params: Optional[dict[str, Any]] = None) -> None:
         """Send a JSON-RPC notification (no response expected)."""
@@ -269,11 +496,11 @@ class ZedAgentConnection:
             self._logger.error("Authentication failed", extra={"error": str(e), "method_id": method_id})
             raise
 
-    async def start_session(self, cwd: str, mcp_servers: list[dict[str, Any]] | None = None) -> str:
+    async def start_session(self, cwd: str, mcp_servers: Sequence[dict[str, Any]] | None = None) -> str:
         """Create a new session and return its identifier."""
         params = {
             "cwd": cwd,
-            "mcpServers": mcp_servers or []
+            "mcpServers": mcp_servers or ()
         }
         self._logger.info("=== SESSION CREATION PHASE ===")
         self._logger.debug("Sending session/new request", extra={"params": params})
@@ -288,36 +515,34 @@ class ZedAgentConnection:
             self._logger.error("Session creation failed", extra={"error": str(e)})
             raise
 
-    async def load_session(self, session_id: str, cwd: str, mcp_servers: list[dict[str, Any]] | None = None) -> None:
+    async def load_session(self, session_id: str, cwd: str, mcp_servers: Sequence[dict[str, Any]] | None = None) -> None:
         """Load an existing session by ID."""
         params = {
             "sessionId": session_id,
             "cwd": cwd,
-            "mcpServers": mcp_servers or []
+            "mcpServers": mcp_servers or ()
         }
         self._logger.info("=== SESSION LOADING PHASE ===")
         self._logger.debug("Sending session/load request", extra={"session_id": session_id, "params": params})
 
-        # Handle the session/load response
-        # The agent will stream conversation history via session/update notifications
-        async def load_handler(payload: dict[str, Any]) -> None:
-            self._logger.debug("Received notification during session load", extra={
-                "method": payload.get("method"),
-                "payload_keys": list(payload.keys())
-            })
-
-            if payload.get("method") == "session/update":
-                params = payload.get("params", {})
-                update_data = params.get("update", {})
-                event = update_data.get("sessionUpdate")
-                self._logger.debug("Session load update", extra={
-                    "event": event,
-                    "update_keys": list(update_data.keys())
-                })
-                # History replay notifications will be sent here
-
+        # The agent streams conversation history via session/update
+        # notifications before it answers session/load
         try:
-            result = await self.request("session/load", params, handler=load_handler)
+            result = None
+            frames = self.stream("session/load", params)
+            try:
+                async for frame in frames:
+                    if "method" not in frame:
+                        result = frame.get("result")
+                    elif self._logger.isEnabledFor(logging.DEBUG):
+                        update_data = (frame.get("params") or {}).get("update") or {}
+                        self._logger.debug("Received notification during session load", extra={
+                            "method": frame.get("method"),
+                            "event": update_data.get("sessionUpdate"),
+                            "update_keys": list(update_data.keys())
+                        })
+            finally:
+                await frames.aclose()
             self._logger.info("Session loaded successfully", extra={
                 "session_id": session_id,
                 "result": result
@@ -346,114 +571,115 @@ class ZedAgentConnection:
         })
         """Send a session/prompt request and return the final result."""
 
-        async def handler(payload: dict[str, Any]) -> None:
-            self._logger.debug("Handling notification during prompt", extra={
-                "method": payload.get("method"),
-                "payload_keys": list(payload.keys())
-            })
+        if cancel_event is None:
+            result = await self._consume_prompt(session_id, prompt, on_chunk)
+            return result or {}
+
+        # Cancelled before the prompt was sent: there is nothing to interrupt
+        if cancel_event.is_set():
+            raise PromptCancelled("External cancellation requested")
+
+        # The prompt runs in the calling task. A single watcher task waits for
+        # external cancellation, tells the agent, and interrupts the caller.
+        current = asyncio.current_task()
+        assert current is not None
+        interrupted = False
+        finished = False
+
+        async def check_external_cancellation() -> None:
+            nonlocal interrupted
+            await cancel_event.wait()
+            logger.info("External cancellation detected", extra={"session_id": session_id})
+            # Send cancellation to the agent when external cancellation is requested
+            try:
+                await self.cancel(session_id)
+            except Exception as e:
+                logger.warning("Failed to send cancellation to agent", extra={"error": str(e)})
+            if not finished:
+                interrupted = True
+                current.cancel()
+
+        cancel_task = asyncio.create_task(check_external_cancellation())
+        try:
+            result = await self._consume_prompt(session_id, prompt, on_chunk)
+        except asyncio.CancelledError:
+            if not interrupted:
+                raise
+            # Python 3.11+ counts cancellation requests; this one has been handled
+            uncancel = getattr(current, "uncancel", None)
+            if uncancel is not None:
+                uncancel()
+            self._logger.info("External cancellation detected during prompt processing", extra={"session_id": session_id})
+            raise PromptCancelled("External cancellation requested") from None
+        finally:
+            finished = True
+            await _drain(cancel_task)
+
+        self._logger.info("Prompt processing completed successfully", extra={
+            "session_id": session_id,
+            "has_result": result is not None,
+            "result_keys": list(result.keys()) if result else []
+        })
+        return result or {}
 
-            if payload.get("method") == "session/update":
-                params = payload.get("params", {})
-                update_data = params.get("update", {})
-                event = update_data.get("sessionUpdate")
-                self._logger.debug("Received session/update notification", extra={
-                    "event": event,
-                    "params_keys": list(params.keys()),
-                    "update_keys": list(update_data.keys())
-                })
-
-                if event == "agent_message_chunk":
-                    # ZedACP protocol: agent_message_chunk is in params.update.content
-                    update_data = params.get("update", {})
-                    content = update_data.get("content", {})
-                    text = content.get("text")
-                    self._logger.debug("Received agent_message_chunk", extra={
-                        "has_text": text is not None,
-                        "text_length": len(text) if text else 0,
-                        "text_preview": text[:100] + "..." if text and len(text) > 100 else (text or "None"),
-                        "content_keys": list(content.keys()),
+    async def _consume_prompt(
+        self,
+        session_id: str,
+        prompt: list[dict[str, Any]],
+        on_chunk: Callable[[str], Coroutine[Any, Any, None]] | None,
+    ) -> dict[str, Any] | None:
+        """Stream a session/prompt request, passing message chunks to ``on_chunk``."""
+        frames = self.stream("session/prompt", {"sessionId": session_id, "prompt": prompt})
+        try:
+            async for frame in frames:
+                method = frame.get("method")
+                if method is None:
+                    return frame.get("result")
+                # Runs once per streamed token. ZedACP frames have a fixed
+                # shape, so index straight in; anything else has no update.
+                try:
+                    update_data = frame["params"]["update"]
+                    event = update_data["sessionUpdate"]
+                except (KeyError, TypeError):
+                    update_data, event = {}, None
+                if self._logger.isEnabledFor(logging.DEBUG):
+                    self._logger.debug("Handling notification during prompt", extra={
+                        "method": method,
+                        "event": event,
                         "update_keys": list(update_data.keys())
                     })
-                    if text and on_chunk:
-                        self._logger.debug("Processing agent message chunk", extra={
-                            "text_length": len(text),
-                            "text_preview": text[:100] + "..." if len(text) > 100 else text
-                        })
-                        await on_chunk(text)
-                    elif on_chunk:
-                        self._logger.warning("Received agent_message_chunk but no text content or no on_chunk handler", extra={
-                            "has_text": text is not None,
-                            "has_on_chunk": on_chunk is not None
-                        })
-                if event == "session/cancelled":
-                    self._logger.warning("Agent reported cancellation via session/update")
+
+                if method == "session/update":
+                    if event == "agent_message_chunk":
+                        # ZedACP protocol: agent_message_chunk is in params.update.content
+                        try:
+                            text = update_data["content"]["text"]
+                        except (KeyError, TypeError):
+                            text = None
+                        if text and on_chunk:
+                            await on_chunk(text)
+                        elif on_chunk:
+                            self._logger.warning("Received agent_message_chunk without text content")
+                    elif event == "session/cancelled":
+                        self._logger.warning("Agent reported cancellation via session/update")
+                        raise PromptCancelled("Agent reported cancellation")
+                elif method == "session/cancelled":
+                    self._logger.warning("Agent reported direct cancellation")
                     raise PromptCancelled("Agent reported cancellation")
-            elif payload.get("method") == "session/cancelled":
-                self._logger.warning("Agent reported direct cancellation")
-                raise PromptCancelled("Agent reported cancellation")
-
-        # If a cancel_event is provided, also check for external cancellation
-        if cancel_event:
-            logger.info("Setting up external cancellation check", extra={"session_id": session_id, "cancel_event_is_set": cancel_event.is_set()})
-            async def check_external_cancellation():
-                logger.info("Waiting for external cancellation", extra={"session_id": session_id})
-                await cancel_event.wait()
-                logger.info("External cancellation detected", extra={"session_id": session_id})
-                # Send cancellation to the agent when external cancellation is requested
-                try:
-                    await self.cancel(session_id)
-                except Exception as e:
-                    logger.warning("Failed to send cancellation to agent", extra={"error": str(e)})
-                raise PromptCancelled("External cancellation requested")
-
-            cancel_task = asyncio.create_task(check_external_cancellation())
-            prompt_task = asyncio.create_task(
-                self.request(
-                    "session/prompt",
-                    {"sessionId": session_id, "prompt": prompt},
-                    handler=handler,
-                )
-            )
-
-            done, pending = await asyncio.wait(
-                {cancel_task, prompt_task},
-                return_when=asyncio.FIRST_COMPLETED,
-            )
-
-            # Cancel the other task
-            for task in pending:
-                task.cancel()
-            await asyncio.gather(*pending, return_exceptions=True)
-
-            if cancel_task in done:
-                # External cancellation was requested
-                logger.info("External cancellation completed first", extra={"session_id": session_id})
-                self._logger.info("External cancellation detected during prompt processing", extra={"session_id": session_id})
-                raise PromptCancelled("External cancellation requested")
-            else:
-                # Prompt completed normally
-                logger.info("Prompt completed normally", extra={"session_id": session_id})
-                result = prompt_task.result()
-                self._logger.info("Prompt processing completed successfully", extra={
-                    "session_id": session_id,
-                    "has_result": result is not None,
-                    "result_keys": list(result.keys()) if result else []
-                })
-                return result or {}
-        else:
-            result = await self.request(
-                "session/prompt",
-                {"sessionId": session_id, "prompt": prompt},
-                handler=handler,
-            )
-            return result or {}
+        finally:
+            await frames.aclose()
+        return None
 
     async def cancel(self, session_id: str | None = None) -> None:
         """Send cancellation request to the agent."""
-        params: dict[str, Any] | None = None
+        # The envelope never changes, so only the session ID is encoded
         if session_id:
-            params = {"sessionId": session_id}
-        await self.notify("session/cancel", params)
+            frame = _CANCEL_SESSION_PREFIX + orjson.dumps(session_id) + b"}}\n"
+        else:
+            frame = _CANCEL_FRAME
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug("Sending notification", extra={"method": "session/cancel", "session_id": session_id})
+        await self._write_frame(frame)
 
     def stderr(self) -> str:
         """Return aggregated stderr output."""
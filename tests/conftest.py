@@ -4,15 +4,24 @@ import json
 import os
 import sys
 from pathlib import Path
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 import pytest
-from fastapi.testclient import TestClient
+from fastapi import FastAPI
 from httpx import AsyncClient, ASGITransport
 
 from acp2_proxy import create_app
 from acp2_proxy.settings import get_settings
 
+try:
+    import uvloop  # noqa: F401
+except ImportError:  # pragma: no cover - e.g. Windows
+    HAS_UVLOOP = False
+else:
+    HAS_UVLOOP = True
+
+AUTH_TOKEN = "test-token"
+
 
 @pytest.fixture(autouse=True)
 def clear_settings_cache() -> Generator[None, None, None]:
@@ -23,15 +32,14 @@ def clear_settings_cache() -> Generator[None, None, None]:
 
 @pytest.fixture()
 def auth_token(monkeypatch: pytest.MonkeyPatch) -> str:
-    token = "test-token"
-    monkeypatch.setenv("ACP2_AUTH_TOKEN", token)
-    return token
+    monkeypatch.setenv("ACP2_AUTH_TOKEN", AUTH_TOKEN)
+    return AUTH_TOKEN
 
 
-@pytest.fixture()
-def agents_config(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+@pytest.fixture(scope="session")
+def agents_config_file(tmp_path_factory: pytest.TempPathFactory) -> Path:
     agent_script = Path(__file__).parent / "dummy_agent.py"
-    config_path = tmp_path / "agents.json"
+    config_path = tmp_path_factory.mktemp("config") / "agents.json"
     config_path.write_text(
         json.dumps(
             {
@@ -51,28 +59,51 @@ def agents_config(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
             }
         )
     )
-    monkeypatch.setenv("ACP2_AGENTS_CONFIG", str(config_path))
     return config_path
 
 
 @pytest.fixture()
-def client(auth_token: str, agents_config: Path) -> Generator[TestClient, None, None]:
-    app = create_app()
-    with TestClient(app) as test_client:
-        test_client.headers.update({"Authorization": f"Bearer {auth_token}"})
-        yield test_client
+def agents_config(agents_config_file: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setenv("ACP2_AGENTS_CONFIG", str(agents_config_file))
+    return agents_config_file
 
 
 @pytest.fixture()
-async def async_client(auth_token: str, agents_config: Path):
-    app = create_app()
-    transport = ASGITransport(app=app)
-    async with app.router.lifespan_context(app):
+def session_db(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Give each app its own database, so tests stay isolated under pytest -n."""
+    db_path = tmp_path / "sessions.db"
+    monkeypatch.setenv("ACP2_DB_PATH", str(db_path))
+    return db_path
+
+
+@pytest.fixture(scope="session")
+def shared_app() -> FastAPI:
+    """One app for every client test; each client still runs its own lifespan."""
+    with pytest.MonkeyPatch.context() as patch:
+        # The auth dependency captures the token when the app is built
+        patch.setenv("ACP2_AUTH_TOKEN", AUTH_TOKEN)
+        get_settings.cache_clear()
+        app = create_app()
+    get_settings.cache_clear()
+    return app
+
+
+@pytest.fixture()
+async def async_client(shared_app: FastAPI, auth_token: str, agents_config: Path, session_db: Path):
+    transport = ASGITransport(app=shared_app)
+    async with shared_app.router.lifespan_context(shared_app):
         async with AsyncClient(transport=transport, base_url="http://testserver") as test_client:
             test_client.headers.update({"Authorization": f"Bearer {auth_token}"})
             yield test_client
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def anyio_backend():
-    return "asyncio"
+    # uvloop ships with uvicorn[standard] on platforms that support it
+    return "asyncio", {"use_uvloop": HAS_UVLOOP}
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def _shared_event_loop() -> AsyncGenerator[None, None]:
+    """Keep anyio's runner alive so async tests share one event loop."""
+    yield
@@ -1,31 +1,51 @@
 from __future__ import annotations
 
-import json
+import queue
 import sys
-import time
 import threading
-from typing import Any, Dict, Optional
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import orjson
 
 SESSION_ID = "session-test"
-cancel_event = threading.Event()
-current_request_id_lock = threading.Lock()
-current_request_id: Optional[int] = None
 
 
-def set_current_request(request_id: Optional[int]) -> None:
-    global current_request_id
-    with current_request_id_lock:
-        current_request_id = request_id
+class PromptState:
+    """The prompt being streamed: its request id and the words left to send."""
 
+    def __init__(self, request_id: int, words: list[str], delay: float) -> None:
+        self.request_id = request_id
+        self.words: Deque[str] = deque(words)
+        self.delay = delay
+        self.next_at = time.monotonic() + delay
 
-def get_current_request() -> Optional[int]:
-    with current_request_id_lock:
-        return current_request_id
+
+# Only the main loop touches this; a helper thread just feeds it stdin lines
+current_prompt: Optional[PromptState] = None
 
 
 def send(payload: Dict[str, Any]) -> None:
-    sys.stdout.write(json.dumps(payload) + "\n")
-    sys.stdout.flush()
+    # Stay in bytes end to end, like the proxy does
+    sys.stdout.buffer.write(orjson.dumps(payload) + b"\n")
+    sys.stdout.buffer.flush()
+
+
+def send_chunk(text: str) -> None:
+    send(
+        {
+            "jsonrpc": "2.0",
+            "method": "session/update",
+            "params": {
+                "sessionId": SESSION_ID,
+                "update": {
+                    "sessionUpdate": "agent_message_chunk",
+                    "content": {"type": "text", "text": text}
+                }
+            },
+        }
+    )
 
 
 def handle_initialize(message: Dict[str, Any]) -> None:
@@ -37,8 +57,7 @@ def handle_session_new(message: Dict[str, Any]) -> None:
 
 
 def handle_session_prompt(message: Dict[str, Any]) -> None:
-    cancel_event.clear()
-    set_current_request(message["id"])
+    global current_prompt
 
     prompt_data = message.get("params", {}).get("prompt", [])
     print(f"dummy agent prompt: {prompt_data}", file=sys.stderr, flush=True)
@@ -54,91 +73,49 @@ def handle_session_prompt(message: Dict[str, Any]) -> None:
         # Handle legacy string format
         prompt_text = str(prompt_data)
 
-    def worker() -> None:
-        try:
-            start = time.time()
-            words = prompt_text.split()
-            check_count = 0
-            while True:
-                # Check for cancellation more frequently
-                if cancel_event.wait(0.05):  # Check every 50ms instead of 100ms
-                    print("dummy agent prompt cancelled", file=sys.stderr, flush=True)
-                    set_current_request(None)
-                    return
-                if words:
-                    word = words.pop(0)
-                    send(
-                        {
-                            "jsonrpc": "2.0",
-                            "method": "session/update",
-                            "params": {
-                                "sessionId": SESSION_ID,
-                                "update": {
-                                    "sessionUpdate": "agent_message_chunk",
-                                    "content": {"type": "text", "text": f"{word} "}
-                                }
-                            },
-                        }
-                    )
-                    # Also check for cancellation after sending each message
-                    if cancel_event.is_set():
-                        print("dummy agent prompt cancelled after sending message", file=sys.stderr, flush=True)
-                        set_current_request(None)
-                        return
-                check_count += 1
-                # Run for a shorter time to make cancellation more testable
-                if time.time() - start >= 2.0:  # Reduced from 5.0 to 2.0 seconds
-                    break
-            send({"jsonrpc": "2.0", "id": message["id"], "result": {"stopReason": "stop"}})
-            set_current_request(None)
-        except Exception as exc:  # pragma: no cover - debug aid
-            send(
-                {
-                    "jsonrpc": "2.0",
-                    "method": "session/update",
-                    "params": {
-                        "sessionId": SESSION_ID,
-                        "update": {
-                            "sessionUpdate": "agent_message_chunk",
-                            "content": {"type": "text", "text": f"error: {exc}"}
-                        }
-                    },
-                }
-            )
-
-    t = threading.Thread(target=worker, name="dummy-agent-prompt", daemon=True)
-    t.start()
-
-
+    # "::delay<seconds>" paces the chunks so tests can cancel mid-stream;
+    # otherwise the reply is streamed back-to-back
+    delay = 0.0
+    words = []
+    for word in prompt_text.split():
+        if word == "::cancelled":
+            # Report cancellation the terse way some agents do: no params
+            send({"jsonrpc": "2.0", "method": "session/cancelled"})
+            return
+        if word.startswith("::delay"):
+            delay = float(word[len("::delay"):])
+        else:
+            words.append(word)
+    current_prompt = PromptState(message["id"], words, delay)
+
+
+def advance_prompt() -> None:
+    """Send the next word of the current prompt, or its result once done."""
+    global current_prompt
+    prompt = current_prompt
+    assert prompt is not None
+    if prompt.words:
+        send_chunk(f"{prompt.words.popleft()} ")
+        prompt.next_at = time.monotonic() + prompt.delay
+        return
+    send({"jsonrpc": "2.0", "id": prompt.request_id, "result": {"stopReason": "stop"}})
+    current_prompt = None
 
 
 def handle_session_cancel(_: Dict[str, Any]) -> None:
+    global current_prompt
     print("dummy agent: cancel received", file=sys.stderr, flush=True)
-    cancel_event.set()
-    send(
-        {
-            "jsonrpc": "2.0",
-            "method": "session/update",
-            "params": {
-                "sessionId": SESSION_ID,
-                "update": {
-                    "sessionUpdate": "agent_message_chunk",
-                    "content": {"type": "text", "text": "cancel acknowledged"}
-                }
-            },
-        }
-    )
+    send_chunk("cancel acknowledged")
     send({"jsonrpc": "2.0", "method": "session/cancelled", "params": {"sessionId": SESSION_ID}})
-    request_id = get_current_request()
-    if request_id is not None:
+    if current_prompt is not None:
         send(
             {
                 "jsonrpc": "2.0",
-                "id": request_id,
+                "id": current_prompt.request_id,
                 "error": {"code": 499, "message": "cancelled"},
             }
         )
-        set_current_request(None)
+        current_prompt = None
 
 
 HANDLERS = {
@@ -149,19 +126,47 @@ HANDLERS = {
 }
 
 
+def dispatch(raw: bytes) -> bool:
+    """Handle one stdin line; return False once the agent should exit."""
+    raw = raw.strip()
+    if not raw:
+        return True
+    message = orjson.loads(raw)
+    method = message.get("method")
+    handler = HANDLERS.get(method)
+    if handler is None:
+        if "id" in message:
+            send({
+                "jsonrpc": "2.0",
+                "id": message["id"],
+                "error": {"code": -32601, "message": f"Method not found: {method}"},
+            })
+        return True
+    handler(message)
+    return method != "session/cancel"
+
+
+def read_stdin(lines: "queue.Queue[Optional[bytes]]") -> None:
+    # Blocking line iteration works on every platform; None marks EOF
+    for raw in sys.stdin.buffer:
+        lines.put(raw)
+    lines.put(None)
+
+
 def main() -> None:
-    for raw in sys.stdin:
-        raw = raw.strip()
-        if not raw:
-            continue
-        message = json.loads(raw)
-        method = message.get("method")
-        handler = HANDLERS.get(method)
-        if handler is None:
+    lines: "queue.Queue[Optional[bytes]]" = queue.Queue()
+    threading.Thread(target=read_stdin, args=(lines,), daemon=True).start()
+    while True:
+        timeout = None
+        if current_prompt is not None:
+            timeout = max(0.0, current_prompt.next_at - time.monotonic())
+        try:
+            raw = lines.get(timeout=timeout)
+        except queue.Empty:
+            advance_prompt()
             continue
-        handler(message)
-        if method == "session/cancel":
-            break
+        if raw is None or not dispatch(raw):
+            return
 
 
 if __name__ == "__main__":
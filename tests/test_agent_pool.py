@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+from acp2_proxy.agent_pool import AgentConnectionPool
+from acp2_proxy.models import AgentConfig
+
+AGENT = AgentConfig(name="test", command=[sys.executable, str(Path(__file__).parent / "dummy_agent.py")])
+
+
+@pytest.mark.anyio("asyncio")
+async def test_checkout_uses_warm_connection_and_refills() -> None:
+    pool = AgentConnectionPool(size=1)
+    pool.warm([AGENT])
+    for _ in range(100):
+        if pool._idle.get(("test", tuple(AGENT.command), None)):
+            break
+        await asyncio.sleep(0.05)
+    warm = pool._idle[("test", tuple(AGENT.command), None)][0]
+
+    connection = await pool.checkout(AGENT)
+    assert connection is warm
+    assert connection.running
+    assert await connection.start_session(cwd=".") == "session-test"
+
+    pool.checkin(connection)
+    await pool.close()
+    assert not connection.running
+
+
+@pytest.mark.anyio("asyncio")
+async def test_checkout_without_pool_spawns_inline() -> None:
+    pool = AgentConnectionPool(size=0)
+    connection = await pool.checkout(AGENT)
+    assert connection.running
+    pool.checkin(connection)
+    await pool.close()
+    assert not pool._idle
+
+
+@pytest.mark.anyio("asyncio")
+async def test_session_connection_is_parked_between_runs() -> None:
+    pool = AgentConnectionPool(size=0, session_keepalive=0.2)
+    connection, zed_session_id = await pool.checkout_session(AGENT, "acp-1")
+    assert zed_session_id is None
+    zed_session_id = await connection.start_session(cwd=".")
+
+    pool.checkin(connection, AGENT, "acp-1", zed_session_id)
+    reused, reused_session_id = await pool.checkout_session(AGENT, "acp-1")
+    assert reused is connection
+    assert reused_session_id == zed_session_id
+    assert await reused.prompt(zed_session_id, [{"type": "text", "text": "again"}])
+
+    # Parked connections are shut down once the keepalive runs out
+    pool.checkin(reused, AGENT, "acp-1", zed_session_id)
+    for _ in range(100):
+        if not connection.running:
+            break
+        await asyncio.sleep(0.05)
+    assert not connection.running
+    await pool.close()
+
+
+@pytest.mark.anyio("asyncio")
+async def test_parked_sessions_are_capped() -> None:
+    pool = AgentConnectionPool(size=0, max_parked_sessions=2)
+    connections = []
+    for acp_session_id in ("acp-1", "acp-2", "acp-3"):
+        connection, _ = await pool.checkout_session(AGENT, acp_session_id)
+        pool.checkin(connection, AGENT, acp_session_id, await connection.start_session(cwd="."))
+        connections.append(connection)
+
+    # The session parked first made room for the newest one
+    assert list(pool._sessions) == ["acp-2", "acp-3"]
+    for _ in range(100):
+        if not connections[0].running:
+            break
+        await asyncio.sleep(0.05)
+    assert not connections[0].running
+    assert connections[2].running
+    await pool.close()
+
+
+@pytest.mark.anyio("asyncio")
+async def test_concurrent_requests_share_one_connection() -> None:
+    pool = AgentConnectionPool(size=0)
+    connection = await pool.checkout(AGENT)
+    # Responses are routed by id, so requests no longer queue behind a read lock
+    results = await asyncio.gather(*(connection.start_session(cwd=".") for _ in range(5)))
+    assert results == ["session-test"] * 5
+    pool.checkin(connection)
+    await pool.close()
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
-from fastapi.testclient import TestClient
+import pytest
 
 
-def test_ping(client: TestClient) -> None:
-    response = client.get("/ping")
+@pytest.mark.anyio("asyncio")
+async def test_ping(async_client) -> None:
+    response = await async_client.get("/ping")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
 
-def test_list_agents(client: TestClient) -> None:
-    response = client.get("/agents")
+@pytest.mark.anyio("asyncio")
+async def test_list_agents(async_client) -> None:
+    response = await async_client.get("/agents")
     assert response.status_code == 200
     payload = response.json()
     # Should return all configured agents
@@ -19,9 +21,18 @@ def test_list_agents(client: TestClient) -> None:
     assert "test" in agent_names  # Our test agent should be present
 
 
-def test_agent_manifest(client: TestClient) -> None:
-    response = client.get("/agents/test")
+@pytest.mark.anyio("asyncio")
+async def test_agent_manifest(async_client) -> None:
+    response = await async_client.get("/agents/test")
     assert response.status_code == 200
     data = response.json()
     assert data["name"] == "test"
     assert data["capabilities"]["modes"] == ["sync", "stream"]
+
+
+@pytest.mark.anyio("asyncio")
+async def test_ping_requires_valid_bearer_token(async_client) -> None:
+    response = await async_client.get("/ping", headers={"Authorization": ""})
+    assert response.status_code == 401
+    response = await async_client.get("/ping", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
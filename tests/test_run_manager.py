@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from acp2_proxy.models import RunMode
+from acp2_proxy.run_manager import RunManager
+
+
+@pytest.mark.anyio("asyncio")
+async def test_wait_for_session_wakes_when_session_is_set() -> None:
+    manager = RunManager()
+    run = await manager.create_run("test", RunMode.sync)
+
+    waiter = asyncio.create_task(manager.wait_for_session(run.id, timeout=5))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    await manager.set_session_id(run.id, "session-1")
+    assert await asyncio.wait_for(waiter, timeout=1) == "session-1"
+
+
+@pytest.mark.anyio("asyncio")
+async def test_wait_for_session_times_out() -> None:
+    manager = RunManager()
+    run = await manager.create_run("test", RunMode.sync)
+    assert await manager.wait_for_session(run.id, timeout=0.01) is None
+    assert await manager.wait_for_session("missing", timeout=0.01) is None
+
+
+@pytest.mark.anyio("asyncio")
+async def test_finished_runs_are_retired_to_a_bounded_lru() -> None:
+    manager = RunManager(max_terminal_runs=2)
+    runs = [await manager.create_run("test", RunMode.sync) for _ in range(3)]
+    for run in runs:
+        await manager.append_output_part(run.id, "hi")
+        await manager.complete_run(run.id, "stop")
+
+    assert manager._runs == {}
+    # The oldest finished run was evicted; the others stay queryable
+    with pytest.raises(KeyError):
+        await manager.get_run(runs[0].id)
+    finished = await manager.get_run(runs[2].id)
+    assert finished.status == "completed"
+
+    # Cancelling a finished run reports its final state
+    response = await manager.request_cancel(runs[2].id)
+    assert response.status == "completed"
+
+    # A late cancel_run neither rewrites the terminal state nor fails once evicted
+    cancelled = await manager.cancel_run(runs[2].id)
+    assert cancelled is not None and cancelled.status == "completed"
+    assert await manager.cancel_run(runs[0].id) is None
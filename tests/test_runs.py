@@ -1,63 +1,52 @@
 from __future__ import annotations
 
-import asyncio
-import json
-import json
-from typing import Generator, Iterable, List, Tuple
+from typing import Iterable, List, Tuple
 
+import orjson
 import pytest
 
-from fastapi.testclient import TestClient
-
 
 def user_message(text: str) -> dict:
     return {"role": "user", "content": [{"type": "text", "text": text}]}
 
 
-def iter_sse(response) -> Generator[Tuple[str, dict], None, None]:
-    buffer = ""
-    for chunk in response.iter_text():
-        buffer += chunk
-        while "\n\n" in buffer:
-            raw_event, buffer = buffer.split("\n\n", 1)
-            event_name = None
-            data_lines: List[str] = []
-            for line in raw_event.splitlines():
-                if line.startswith("event: "):
-                    event_name = line[len("event: ") :]
-                elif line.startswith("data: "):
-                    data_lines.append(line[len("data: ") :])
-            if not event_name:
-                continue
-            data_json = "\n".join(data_lines)
-            yield event_name, json.loads(data_json)
+class SSEDecoder:
+    """Split an SSE byte stream into ``(event, data)`` pairs."""
 
+    def __init__(self) -> None:
+        self._buffer = b""
 
-async def async_iter_sse(response):
-    buffer = ""
-    async for chunk in response.aiter_text():
-        buffer += chunk
-        while "\n\n" in buffer:
-            raw_event, buffer = buffer.split("\n\n", 1)
+    def feed(self, chunk: bytes) -> List[Tuple[str, dict]]:
+        *blocks, self._buffer = (self._buffer + chunk).split(b"\n\n")
+        events: List[Tuple[str, dict]] = []
+        for block in blocks:
             event_name = None
-            data_lines: List[str] = []
-            for line in raw_event.splitlines():
-                if line.startswith("event: "):
-                    event_name = line[len("event: ") :]
-                elif line.startswith("data: "):
-                    data_lines.append(line[len("data: ") :])
+            data_lines = []
+            for line in block.split(b"\n"):
+                if line.startswith(b"event: "):
+                    event_name = line[len(b"event: "):].decode()
+                elif line.startswith(b"data: "):
+                    data_lines.append(line[len(b"data: "):])
             if event_name:
-                data_json = "\n".join(data_lines)
-                yield event_name, json.loads(data_json)
+                events.append((event_name, orjson.loads(b"\n".join(data_lines))))
+        return events
+
+
+async def async_iter_sse(response):
+    decoder = SSEDecoder()
+    async for chunk in response.aiter_bytes():
+        for event in decoder.feed(chunk):
+            yield event
 
 
-def test_run_sync(client: TestClient) -> None:
+@pytest.mark.anyio("asyncio")
+async def test_run_sync(async_client) -> None:
     payload = {
         "agent": "test",
         "mode": "sync",
         "input": user_message("hello world"),
     }
-    response = client.post("/runs", json=payload)
+    response = await async_client.post("/runs", json=payload)
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "completed"
@@ -67,24 +56,60 @@ def test_run_sync(client: TestClient) -> None:
     assert data["stop_reason"] == "stop"
 
 
-def test_run_stream(client: TestClient) -> None:
+@pytest.mark.anyio("asyncio")
+async def test_run_agent_reported_cancellation(async_client) -> None:
+    # The agent's session/cancelled carries no sessionId; it must still reach the prompt
+    payload = {
+        "agent": "test",
+        "mode": "sync",
+        "input": user_message("::cancelled"),
+    }
+    response = await async_client.post("/runs", json=payload)
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+
+
+@pytest.mark.anyio("asyncio")
+async def test_run_stream(async_client) -> None:
     payload = {
         "agent": "test",
         "mode": "stream",
         "input": user_message("streaming test"),
     }
-    with client.stream("POST", "/runs", json=payload) as response:
-        events = list(iter_sse(response))
-    event_names = [name for name, _ in events]
-    assert event_names[0] == "run.started"
-    assert "message.part" in event_names
-    assert event_names[-1] == "run.completed"
-    completed_event = next(data for name, data in events if name == "run.completed")
+    async with async_client.stream("POST", "/runs", json=payload) as response:
+        # SSE frames must reach the client uncompressed as they are produced
+        assert "content-encoding" not in response.headers
+        # Check events as they arrive and stop at the terminal one
+        first_event = None
+        saw_part = False
+        completed_event = None
+        async for name, data in async_iter_sse(response):
+            if first_event is None:
+                first_event = name
+            if name == "message.part":
+                saw_part = True
+            elif name == "run.completed":
+                completed_event = data
+                break
+    assert first_event == "run.started"
+    assert saw_part
+    assert completed_event is not None
     assert completed_event["status"] == "completed"
     message = "".join(part["text"] for part in completed_event["output"]["content"])
     assert "streaming" in message
 
 
+@pytest.mark.anyio("asyncio")
+async def test_session_listing_is_gzipped(async_client, shared_app) -> None:
+    database = shared_app.state.database
+    for index in range(5):
+        await database.create_acp_session(f"session-{index}", "test", "/tmp", f"zed-{index}")
+    response = await async_client.get("/sessions", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 5
+
+
 @pytest.mark.anyio("asyncio")
 async def test_run_cancellation(async_client) -> None:
     payload = {
@@ -101,9 +126,9 @@ async def test_run_cancellation(async_client) -> None:
             events_received.append(event)
             if event == "run.started":
                 run_id = data["id"]
-                # Wait a bit for the agent to actually start processing
-                await asyncio.sleep(0.1)
-                # Cancel while agent is running to test proper cancellation
+            if event == "message.part" and cancel_info is None:
+                # The first part means the agent is mid-stream: ::delay0.1
+                # keeps it producing, so cancel now
                 cancel_response = await async_client.post(f"/runs/{run_id}/cancel")
                 assert cancel_response.status_code == 200
                 cancel_info = cancel_response.json()
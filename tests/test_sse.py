@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from acp2_proxy.sse import SSEBuffer
+
+
+@pytest.mark.anyio("asyncio")
+async def test_sse_buffer_coalesces_frames() -> None:
+    buffer = SSEBuffer()
+    await buffer.write(b"event: a\n\n")
+    await buffer.write_frame(b"event: b\ndata: ", b"{}")
+    buffer.close()
+
+    chunks = [chunk async for chunk in buffer]
+    assert chunks == [b"event: a\n\nevent: b\ndata: {}\n\n"]
+
+
+@pytest.mark.anyio("asyncio")
+async def test_sse_buffer_applies_backpressure() -> None:
+    buffer = SSEBuffer(high_water=4)
+    writer = asyncio.create_task(buffer.write(b"12345"))
+    await asyncio.sleep(0)
+    assert not writer.done()
+
+    chunks = buffer.__aiter__()
+    assert await chunks.__anext__() == b"12345"
+    await asyncio.wait_for(writer, timeout=1)
+    buffer.close()
+    assert [chunk async for chunk in chunks] == []
+
+
+@pytest.mark.anyio("asyncio")
+async def test_sse_buffer_close_releases_blocked_writer() -> None:
+    buffer = SSEBuffer(high_water=4)
+    writer = asyncio.create_task(buffer.write(b"12345"))
+    await asyncio.sleep(0)
+    assert not writer.done()
+
+    buffer.close()
+    await asyncio.wait_for(writer, timeout=1)
+    await buffer.write(b"dropped")
+    assert [chunk async for chunk in buffer] == [b"12345"]
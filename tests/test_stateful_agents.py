@@ -7,44 +7,40 @@ Tests session persistence, message history, and session management features.
 import pytest
 import asyncio
 import json
-import tempfile
-from pathlib import Path
+import uuid
+from types import MappingProxyType
 
 from src.acp2_proxy.database import SessionDatabase, ACPSession
 from src.acp2_proxy.session_manager import SessionManager
-from src.acp2_proxy.models import Message, MessagePart
+from src.acp2_proxy.models import AgentConfig, Message, MessagePart
 
 
 @pytest.fixture
-def temp_db():
-    """Create a temporary database for testing."""
-    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as f:
-        db_path = f.name
-
-    yield db_path
-
-    # Cleanup
-    Path(db_path).unlink(missing_ok=True)
+def temp_db(tmp_path):
+    """Create a temporary database for testing; pytest removes tmp_path."""
+    return str(tmp_path / "session.db")
 
 
 @pytest.fixture
-async def database(temp_db):
-    """Create database instance for testing."""
-    db = SessionDatabase(temp_db)
-    yield db
-    db.close()
+async def database():
+    """Create an in-memory database shared by the instance's connections."""
+    db = SessionDatabase(f"file:acp2-test-{uuid.uuid4().hex}?mode=memory&cache=shared")
+    try:
+        yield db
+    finally:
+        await db.aclose()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def agent_config():
-    """Sample agent configuration for testing."""
-    return {
-        "test-agent": {
-            "name": "test-agent",
-            "command": ["python", "tests/dummy_agent.py"],
-            "description": "Test agent for stateful functionality"
-        }
-    }
+    """Sample agent configuration for testing, shared read-only by every test."""
+    return MappingProxyType({
+        "test-agent": AgentConfig(
+            name="test-agent",
+            command=["python", "tests/dummy_agent.py"],
+            description="Test agent for stateful functionality"
+        )
+    })
 
 
 @pytest.fixture
@@ -82,6 +78,70 @@ class TestSessionDatabase:
         not_found = await database.get_acp_session("non_existent")
         assert not_found is None
 
+    @pytest.mark.anyio
+    async def test_session_cache(self, database):
+        """Test that session reads are cached and writes invalidate them."""
+        await database.create_acp_session("cached_session", "test-agent", "/test", "zed_1")
+
+        first = await database.get_acp_session("cached_session")
+        second = await database.get_acp_session("cached_session")
+        assert first is second
+        assert database.session_cache_stats()["hits"] == 1
+
+        await database.update_zed_session_id("cached_session", "zed_2")
+        updated = await database.get_acp_session("cached_session")
+        assert updated.zed_session_id == "zed_2"
+
+        # Touching replaces the cached entry; objects already handed out don't change
+        handed_out_at = updated.updated_at
+        await database.touch_acp_session("cached_session")
+        touched = await database.get_acp_session("cached_session")
+        assert updated.updated_at == handed_out_at
+        assert touched.updated_at > handed_out_at
+
+    @pytest.mark.anyio
+    async def test_session_cache_skips_rows_raced_by_a_write(self, database, monkeypatch):
+        """Test that a row read while the session was written is not cached."""
+        await database.create_acp_session("raced_session", "test-agent", "/test", "zed_1")
+        fetch = database._fetch
+
+        async def fetch_then_write(sql, params):
+            rows = await fetch(sql, params)
+            await database.update_zed_session_id("raced_session", "zed_2")
+            return rows
+
+        monkeypatch.setattr(database, "_fetch", fetch_then_write)
+        stale = await database.get_acp_session("raced_session")
+        assert stale.zed_session_id == "zed_1"
+        monkeypatch.setattr(database, "_fetch", fetch)
+
+        fresh = await database.get_acp_session("raced_session")
+        assert fresh.zed_session_id == "zed_2"
+
+    @pytest.mark.anyio
+    async def test_cancelled_write_holds_lock_until_thread_finishes(self, database, monkeypatch):
+        """Test that cancelling a writer does not free the writer connection early."""
+        import threading
+        started, release = threading.Event(), threading.Event()
+        write_sync = database._write_sync
+
+        def slow_write_sync(statements):
+            started.set()
+            release.wait(5)
+            return write_sync(statements)
+
+        monkeypatch.setattr(database, "_write_sync", slow_write_sync)
+        writer = asyncio.create_task(database.touch_acp_session("missing"))
+        await asyncio.to_thread(started.wait, 5)
+        writer.cancel()
+        await asyncio.sleep(0.01)
+        assert database._write_lock.locked()
+
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await writer
+        assert not database._write_lock.locked()
+
     @pytest.mark.anyio
     async def test_session_history(self, database):
         """Test message history storage and retrieval."""
@@ -132,6 +192,154 @@ class TestSessionDatabase:
         assert history[1].run_id == "run_001"
         assert history[1].sequence_number == 1
 
+    @pytest.mark.anyio
+    async def test_history_is_buffered_until_flush(self, temp_db):
+        """Test that history rows are batched and flushed on demand."""
+        db = SessionDatabase(temp_db, history_batch_size=2, history_flush_ms=60_000)
+        try:
+            await db.create_acp_session("buffered_session", "test-agent", "/test", "zed_buf")
+            message = Message(role="user", content=[MessagePart(type="text", text="hi")])
+
+            await db.append_message_history("buffered_session", "run_1", message, 0)
+            assert len(db._history_buffer) == 1
+
+            # Reaching the batch size writes the whole buffer at once
+            await db.append_message_history("buffered_session", "run_1", message, 1)
+            assert db._history_buffer == []
+
+            # Reads flush any pending rows first
+            await db.append_message_history("buffered_session", "run_2", message, 0)
+            history = await db.get_session_history("buffered_session")
+            assert [entry.run_id for entry in history].count("run_2") == 1
+            assert len(history) == 3
+        finally:
+            db.close()
+
+    @pytest.mark.anyio
+    async def test_background_flush_failure_is_logged(self, temp_db, caplog, monkeypatch):
+        """Test that a failed timed flush is reported instead of left on the task."""
+        db = SessionDatabase(temp_db, history_flush_ms=1)
+        try:
+            await db.create_acp_session("failing_session", "test-agent", "/test", "zed_f")
+
+            def fail(rows, updates=()):
+                raise RuntimeError("disk gone")
+
+            monkeypatch.setattr(db, "_insert_history_sync", fail)
+            message = Message(role="user", content=[MessagePart(type="text", text="hi")])
+            await db.append_message_history("failing_session", "run_1", message, 0)
+            task = db._history_flush_task
+            await task
+
+            assert task.exception() is None
+            [record] = [r for r in caplog.records if r.message == "Background history flush failed"]
+            assert record.dropped_rows == 1
+        finally:
+            db.close()
+
+    @pytest.mark.anyio
+    async def test_history_append_touches_session(self, temp_db):
+        """Test that touching a session is written with the buffered history row."""
+        db = SessionDatabase(temp_db, history_flush_ms=60_000)
+        try:
+            created = await db.create_acp_session("touched_session", "test-agent", "/test", "zed_t")
+            message = Message(role="user", content=[MessagePart(type="text", text="hi")])
+            await db.append_message_history("touched_session", "run_1", message, 0, touch_session=True)
+            assert db._pending_touches
+
+            # Queries that depend on updated_at flush the pending touch first
+            [session] = await db.list_acp_sessions()
+            assert session.updated_at > created.updated_at
+            assert db._history_buffer == []
+        finally:
+            db.close()
+
+    @pytest.mark.anyio
+    async def test_session_history_pagination(self, database):
+        """Test keyset pagination over session history."""
+        await database.create_acp_session("paged_session", "test-agent", "/test", "zed_paged")
+        for run in range(3):
+            for sequence_number, role in enumerate(("user", "assistant")):
+                message = Message(role=role, content=[MessagePart(type="text", text=f"{run}")])
+                await database.append_message_history("paged_session", f"run_{run}", message, sequence_number)
+
+        first_page = await database.get_session_history("paged_session", limit=4)
+        assert [entry.run_id for entry in first_page] == ["run_0", "run_0", "run_1", "run_1"]
+
+        second_page = await database.get_session_history(
+            "paged_session", limit=4, after_id=first_page[-1].id
+        )
+        assert [(entry.run_id, entry.message_role) for entry in second_page] == [
+            ("run_2", "user"),
+            ("run_2", "assistant"),
+        ]
+        # The count covers the whole history, not a page of it
+        assert await database.count_session_history("paged_session") == 6
+
+    @pytest.mark.anyio
+    async def test_legacy_database_is_migrated(self, temp_db):
+        """Test that databases with TEXT timestamps and payloads are upgraded."""
+        import sqlite3
+        conn = sqlite3.connect(temp_db)
+        conn.executescript("""
+            CREATE TABLE acp_sessions (
+                acp_session_id TEXT PRIMARY KEY, agent_name TEXT NOT NULL,
+                zed_session_id TEXT NOT NULL, working_directory TEXT NOT NULL,
+                created_at TEXT NOT NULL, updated_at TEXT NOT NULL,
+                is_active BOOLEAN DEFAULT 1, last_run_id TEXT, metadata TEXT
+            );
+            CREATE TABLE session_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, acp_session_id TEXT NOT NULL,
+                run_id TEXT NOT NULL, message_role TEXT NOT NULL, message_data TEXT NOT NULL,
+                created_at TEXT NOT NULL, sequence_number INTEGER, zed_message_data TEXT
+            );
+        """)
+        conn.execute(
+            "INSERT INTO acp_sessions VALUES (?, ?, ?, ?, ?, ?, 1, NULL, NULL)",
+            ("legacy_session", "test-agent", "zed_legacy", "/test",
+             "2024-01-01T00:00:00", "2024-01-02T03:04:05.000006"),
+        )
+        conn.execute(
+            "INSERT INTO session_history (acp_session_id, run_id, message_role, message_data,"
+            " created_at, sequence_number) VALUES (?, ?, ?, ?, ?, ?)",
+            ("legacy_session", "run_old", "user",
+             json.dumps({"role": "user", "content": [{"type": "text", "text": "old"}]}),
+             "2024-01-01T00:00:00", 0),
+        )
+        conn.commit()
+        conn.close()
+
+        db = SessionDatabase(temp_db)
+        try:
+            session = await db.get_acp_session("legacy_session")
+            assert session.updated_at.isoformat() == "2024-01-02T03:04:05.000006"
+
+            history = await db.get_session_history("legacy_session")
+            assert history[0].message_data["content"][0]["text"] == "old"
+            assert history[0].created_at.isoformat() == "2024-01-01T00:00:00"
+
+            rows = await db._fetch(
+                "SELECT typeof(message_data), typeof(created_at) FROM session_history", ()
+            )
+            assert tuple(rows[0]) == ("blob", "integer")
+        finally:
+            db.close()
+
+    @pytest.mark.anyio
+    async def test_create_sessions_in_bulk(self, database):
+        """Test creating several sessions in one call."""
+        created = await database.create_acp_sessions([
+            ("bulk_1", "agent_a", "/dir1", "zed_1"),
+            ("bulk_2", "agent_b", "/dir2", "zed_2"),
+        ])
+        assert [session.acp_session_id for session in created] == ["bulk_1", "bulk_2"]
+
+        retrieved = await database.get_acp_session("bulk_2")
+        assert retrieved.agent_name == "agent_b"
+        assert retrieved.working_directory == "/dir2"
+        assert retrieved.zed_session_id == "zed_2"
+        assert len(await database.list_acp_sessions()) == 2
+
     @pytest.mark.anyio
     async def test_list_sessions(self, database):
         """Test listing sessions with filtering."""
@@ -176,6 +384,22 @@ class TestSessionDatabase:
         assert not_deleted is False
 
 
+    @pytest.mark.anyio
+    async def test_cleanup_inactive_sessions(self, database):
+        """Test that only inactive sessions older than the cutoff are removed."""
+        await database.create_acp_session("stale", "test", "/tmp", "zed_stale")
+        await database.create_acp_session("recent", "test", "/tmp", "zed_recent")
+        await database._write(
+            ("UPDATE acp_sessions SET is_active = 0, updated_at = ? WHERE acp_session_id = ?",
+             (946684800000000, "stale")),  # 2000-01-01 in epoch microseconds
+            ("UPDATE acp_sessions SET is_active = 0 WHERE acp_session_id = ?", ("recent",)),
+        )
+
+        assert await database.cleanup_inactive_sessions(days_old=30) == 1
+        assert await database.get_acp_session("stale") is None
+        assert await database.get_acp_session("recent") is not None
+
+
 class TestSessionManager:
     """Test the session manager functionality."""
 
@@ -250,6 +474,46 @@ class TestSessionManager:
         assert updated_session is not None
         assert updated_session.last_run_id == "run_123"
 
+    @pytest.mark.anyio
+    async def test_concurrent_get_or_create_creates_once(self, session_manager):
+        """Test that concurrent first requests for a session share one creation."""
+        results = await asyncio.gather(*(
+            session_manager.get_or_create_session("concurrent_test", "test-agent", "/test")
+            for _ in range(5)
+        ))
+        created = [r for r in results if r is session_manager.active_sessions.get("concurrent_test")]
+        assert len(created) == 1
+        assert {r.acp_session.acp_session_id for r in results} == {"concurrent_test"}
+        assert session_manager._creation_locks == {}
+
+    @pytest.mark.anyio
+    async def test_reopening_session_only_bumps_updated_at(self, session_manager):
+        """Test that reusing a session keeps its stored state."""
+        await session_manager.get_or_create_session("touch_test", "test-agent", "/test")
+        await session_manager.update_session_activity("touch_test", "run_789")
+        before = await session_manager.get_acp_session("touch_test")
+
+        reopened = await session_manager.get_or_create_session("touch_test", "test-agent", "/other")
+        assert reopened.acp_session.last_run_id == "run_789"
+        assert reopened.acp_session.working_directory == "/test"
+        assert reopened.acp_session.updated_at >= before.updated_at
+
+    @pytest.mark.anyio
+    async def test_finalize_run(self, session_manager):
+        """Test storing a run's exchange and activity together."""
+        await session_manager.get_or_create_session("finalize_test", "test-agent", "/test")
+
+        user = Message(role="user", content=[{"type": "text", "text": "Hi"}])
+        reply = Message(role="assistant", content=[{"type": "text", "text": "Hello"}])
+        await session_manager.finalize_run("finalize_test", "run_456", user, reply)
+
+        history = await session_manager.get_session_history("finalize_test")
+        assert [(h.message_role, h.sequence_number) for h in history] == [("user", 0), ("assistant", 1)]
+        assert history[1].message_data["content"][0]["text"] == "Hello"
+
+        session = await session_manager.get_acp_session("finalize_test")
+        assert session.last_run_id == "run_456"
+
     @pytest.mark.anyio
     async def test_session_cleanup(self, session_manager):
         """Test session deletion through manager."""
@@ -349,5 +613,36 @@ class TestStatefulIntegration:
         assert session_id not in session_ids_after
 
 
+    @pytest.mark.anyio
+    async def test_stateful_workflow_with_finalize_run(self, session_manager):
+        """Test a multi-run conversation stored the way completed runs are."""
+        session_id = "finalize_workflow_session"
+        await session_manager.get_or_create_session(session_id, "test-agent", "/test/workdir")
+
+        for i, (user_msg, assistant_response) in enumerate([
+            ("Hello, agent!", "Hello! How can I help?"),
+            ("Tell me a joke.", "Why did the chicken cross the road?"),
+        ]):
+            # run_manager builds its messages with model_construct
+            user_message = Message.model_construct(
+                role="user", content=[MessagePart.model_construct(type="text", text=user_msg)]
+            )
+            assistant_message = Message.model_construct(
+                role="assistant", content=[MessagePart.model_construct(type="text", text=assistant_response)]
+            )
+            await session_manager.finalize_run(session_id, f"run_{i}", user_message, assistant_message)
+
+        history = await session_manager.get_session_history(session_id)
+        assert [(h.run_id, h.message_role) for h in history] == [
+            ("run_0", "user"),
+            ("run_0", "assistant"),
+            ("run_1", "user"),
+            ("run_1", "assistant"),
+        ]
+        assert history[3].message_data["content"][0]["text"] == "Why did the chicken cross the road?"
+
+        session = await session_manager.get_acp_session(session_id)
+        assert session.last_run_id == "run_1"
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file